@@ -0,0 +1,282 @@
+"""Offline npm advisory index.
+
+Advisories are imported from an OSV-format dump (a directory or .zip of OSV
+JSON records, local or downloaded, e.g. the GitHub Advisory Database or
+https://osv-vulnerabilities.storage.googleapis.com/npm/all.zip) into a local
+SQLite file. Affected version ranges are stored as pre-encoded, sortable
+bounds, so checking a lockfile is one indexed lookup per package@version
+with no network access while a job runs.
+
+    python -m app.advisories import <path-or-url>
+"""
+
+from app.config import ADVISORY_DB_PATH, ADVISORY_SOURCE, ADVISORY_REFRESH_HOURS
+from app.state import get_store
+import io
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS ranges (
+    package TEXT NOT NULL,
+    advisory TEXT NOT NULL,
+    severity TEXT,
+    summary TEXT,
+    lo TEXT,
+    hi TEXT,
+    hi_inclusive INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ranges_package ON ranges (package);
+"""
+
+_SEMVER = re.compile(r"^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-([0-9A-Za-z.-]+))?(?:\+.*)?$")
+
+
+def encode_version(version):
+    """Encode a semver string so that plain string comparison orders versions correctly"""
+    match = _SEMVER.match(version.strip())
+    if not match:
+        return None
+    major, minor, patch, pre = match.groups()
+    encoded = f"{int(major):08d}.{int(minor or 0):08d}.{int(patch or 0):08d}"
+    if not pre:
+        # "~" sorts after "-", so a release sorts after all of its prereleases
+        return encoded + "~"
+    parts = []
+    for identifier in pre.split("."):
+        # Numeric identifiers sort before alphanumeric ones, numerically among themselves
+        parts.append(f"0{int(identifier):08d}" if identifier.isdigit() else f"1{identifier}")
+    return encoded + "-" + ".".join(parts)
+
+
+def _intervals(events):
+    """(lo, hi, hi_inclusive) bounds from OSV range events.
+
+    A range with a bound that is not semver is skipped: storing None there
+    would make it open-ended and flag every version past it.
+    """
+    intervals = []
+    lo = None
+    open_range = False
+    valid = True
+    for event in events:
+        if "introduced" in event:
+            lo = None if event["introduced"] == "0" else encode_version(event["introduced"])
+            valid = event["introduced"] == "0" or lo is not None
+            open_range = True
+        elif ("fixed" in event or "last_affected" in event) and open_range:
+            hi = encode_version(event.get("fixed") or event["last_affected"])
+            if valid and hi is not None:
+                intervals.append((lo, hi, 0 if "fixed" in event else 1))
+            open_range = False
+    if open_range and valid:
+        intervals.append((lo, None, 0))
+    return intervals
+
+
+def _rows(record):
+    severity = (record.get("database_specific") or {}).get("severity") or "unknown"
+    summary = record.get("summary") or record.get("details", "")[:200]
+    for affected in record.get("affected", []):
+        package = affected.get("package") or {}
+        if package.get("ecosystem") != "npm":
+            continue
+        bounds = []
+        for version_range in affected.get("ranges", []):
+            if version_range.get("type") in ("SEMVER", "ECOSYSTEM"):
+                bounds.extend(_intervals(version_range.get("events", [])))
+        if not bounds:
+            # Records without ranges list the affected versions explicitly
+            encoded = [encode_version(v) for v in affected.get("versions", [])]
+            bounds = [(v, v, 1) for v in encoded if v is not None]
+        for lo, hi, hi_inclusive in bounds:
+            yield (package["name"], record["id"], severity.lower(), summary, lo, hi, hi_inclusive)
+
+
+def _records(source):
+    """Yield OSV records from a directory, a .zip file or a URL to a .zip"""
+    if source.startswith(("http://", "https://")):
+        import requests
+        response = requests.get(source, timeout=300)
+        response.raise_for_status()
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+    elif zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+    else:
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.endswith(".json"):
+                    with open(os.path.join(root, name)) as f:
+                        yield json.load(f)
+        return
+
+    with archive:
+        for name in archive.namelist():
+            if name.endswith(".json"):
+                yield json.loads(archive.read(name))
+
+
+def import_advisories(source, path=ADVISORY_DB_PATH):
+    """Build a fresh index from source and atomically swap it into place"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, staging = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(staging)
+        conn.executescript(_SCHEMA)
+        count = 0
+        for record in _records(source):
+            rows = list(_rows(record))
+            conn.executemany("INSERT INTO ranges VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            count += bool(rows)
+        version = str(int(time.time()))
+        conn.execute("INSERT INTO meta VALUES ('version', ?)", (version,))
+        conn.execute("INSERT INTO meta VALUES ('source', ?)", (source,))
+        conn.commit()
+        conn.close()
+        os.replace(staging, path)
+    except Exception:
+        os.unlink(staging)
+        raise
+    logger.info(f"Imported {count} npm advisories from {source}")
+    return count
+
+
+class AdvisoryIndex:
+    """Read side of the index; reopens the file when a refresh swaps it"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        try:
+            stamp = os.stat(self.path).st_ino
+        except OSError:
+            return None
+        if getattr(self._local, "stamp", None) != stamp:
+            self._local.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.stamp = stamp
+        return self._local.conn
+
+    def version(self):
+        conn = self._conn()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def lookup(self, package, version):
+        conn = self._conn()
+        encoded = encode_version(version)
+        if conn is None or encoded is None:
+            return []
+        return conn.execute(
+            """
+            SELECT DISTINCT advisory, severity, summary FROM ranges
+            WHERE package = ?
+              AND (lo IS NULL OR lo <= ?)
+              AND (hi IS NULL OR hi > ? OR (hi_inclusive = 1 AND hi = ?))
+            """,
+            (package, encoded, encoded, encoded),
+        ).fetchall()
+
+
+index = AdvisoryIndex(ADVISORY_DB_PATH)
+
+
+def locked_packages(workdir):
+    """(name, version) pairs resolved from package-lock.json / npm-shrinkwrap.json, or None"""
+    for name in ("npm-shrinkwrap.json", "package-lock.json"):
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                lock = json.load(f)
+            break
+    else:
+        return None
+
+    packages = set()
+    if "packages" in lock:
+        # lockfileVersion 2/3: flat map keyed by install path
+        for install_path, info in lock["packages"].items():
+            if not install_path or info.get("link") or "version" not in info:
+                continue
+            package_name = info.get("name") or install_path.rsplit("node_modules/", 1)[-1]
+            packages.add((package_name, info["version"]))
+    else:
+        # lockfileVersion 1: nested dependencies
+        stack = [lock.get("dependencies", {})]
+        while stack:
+            for package_name, info in stack.pop().items():
+                if "version" in info:
+                    packages.add((package_name, info["version"]))
+                stack.append(info.get("dependencies", {}))
+    return sorted(packages)
+
+
+def audit_lockfile(workdir):
+    """Known advisories for every locked package, or None when the offline index cannot be used"""
+    if index.version() is None:
+        return None
+    packages = locked_packages(workdir)
+    if packages is None:
+        return None
+
+    findings = []
+    for package_name, version in packages:
+        for advisory, severity, summary in index.lookup(package_name, version):
+            findings.append({
+                "package": package_name,
+                "version": version,
+                "advisory": advisory,
+                "severity": severity,
+                "summary": summary,
+            })
+    return findings
+
+
+def _refresh_loop():
+    store = get_store()
+    # ADVISORY_DB_PATH is local to each host, so the lock and timestamp are too,
+    # even when hosts share a Redis store
+    host = socket.gethostname()
+    while True:
+        try:
+            last = store.get(f"advisories:last_refresh:{host}", 0)
+            if time.time() - last >= ADVISORY_REFRESH_HOURS * 3600:
+                # One refresh per host at a time; other workers reopen the swapped file
+                with store.lock(f"advisories:refresh:{host}", ttl=3600, wait=0):
+                    import_advisories(ADVISORY_SOURCE)
+                    store.set(f"advisories:last_refresh:{host}", time.time())
+        except TimeoutError:
+            pass
+        except Exception as e:
+            logger.error(f"Advisory index refresh failed: {str(e)}")
+        time.sleep(600)
+
+
+def start_refresher():
+    """Refresh the index from ADVISORY_SOURCE in the background, if configured"""
+    if ADVISORY_SOURCE:
+        threading.Thread(target=_refresh_loop, name="advisory-refresh", daemon=True).start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 3 or sys.argv[1] != "import":
+        print("Usage: python -m app.advisories import <path-or-url>")
+        sys.exit(1)
+    import_advisories(sys.argv[2])
@@ -1,9 +1,8 @@
-from github import Github
-from app.config import GITHUB_TOKEN
+from app.auth import get_github
+from app.repo_cache import get_repo
 import logging
 
 logger = logging.getLogger(__name__)
-gh = Github(GITHUB_TOKEN)
 
 async def handle_alerts(event: str, payload: dict):
     try:
@@ -11,7 +10,7 @@ async def handle_alerts(event: str, payload: dict):
         
         logger.info(f"Processing {event} alert in {repo_name}")
         
-        repo = gh.get_repo(repo_name)
+        repo = get_repo(get_github(payload), payload)
         title = f"{event.replace('_', ' ').title()} detected"
         
         # Extract relevant information without exposing sensitive data
@@ -42,8 +41,7 @@ Please review this security alert and take appropriate action."""
         logger.error(f"Error processing alert: {str(e)}")
         # Try to create issue with error message
         try:
-            repo_name = payload["repository"]["full_name"]
-            repo = gh.get_repo(repo_name)
+            repo = get_repo(get_github(payload), payload)
             repo.create_issue(
                 title="Alert Processing Error",
                 body=f"Error processing {event} alert: {str(e)}",
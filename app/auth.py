@@ -0,0 +1,150 @@
+from github import Github, GithubIntegration, Auth
+from app.config import (
+    GITHUB_TOKEN,
+    GITHUB_APP_ID,
+    GITHUB_APP_PRIVATE_KEY,
+    TOKEN_REFRESH_MARGIN_SECONDS,
+)
+from app.state import get_store
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Installations we have minted tokens for; the refresher keeps these warm
+_known = {}
+_clients = {}
+_pool_lock = threading.Lock()
+_refresher = None
+_stop = threading.Event()
+
+
+def installation_id_of(payload):
+    """Installation id from a webhook payload, or None for repository/org webhooks"""
+    installation = payload.get("installation") or {}
+    return installation.get("id") if GITHUB_APP_ID else None
+
+
+def _integration():
+    return GithubIntegration(auth=Auth.AppAuth(GITHUB_APP_ID, GITHUB_APP_PRIVATE_KEY))
+
+
+def _mint(installation_id):
+    """Mint a new installation token and share it with every worker through the state store"""
+    store = get_store()
+    key = f"ghtoken:{installation_id}"
+
+    # Only one worker mints at a time; the others pick up its token
+    with store.lock(key, ttl=60, wait=30):
+        cached = store.get(key)
+        if cached and cached["expires_at"] - time.time() > TOKEN_REFRESH_MARGIN_SECONDS:
+            return cached
+
+        authorization = _integration().get_access_token(installation_id)
+        cached = {
+            "token": authorization.token,
+            "expires_at": authorization.expires_at.timestamp(),
+        }
+        store.set(key, cached, ttl=max(1, int(cached["expires_at"] - time.time())))
+        logger.info(f"Minted token for installation {installation_id}")
+        return cached
+
+
+def _cached_token(installation_id):
+    _known[installation_id] = time.time()
+    cached = get_store().get(f"ghtoken:{installation_id}")
+    if cached and cached["expires_at"] > time.time() + 60:
+        return cached
+    # Only reached before the first prefetch/refresh for this installation
+    logger.warning(f"Cold token mint for installation {installation_id}")
+    return _mint(installation_id)
+
+
+def token_for(payload):
+    """Token to act on the payload's repository: installation token or GITHUB_TOKEN"""
+    installation_id = installation_id_of(payload)
+    if installation_id is None:
+        if not GITHUB_TOKEN:
+            raise ValueError("Webhook has no installation id and GITHUB_TOKEN is not set")
+        return GITHUB_TOKEN
+    return _cached_token(installation_id)["token"]
+
+
+def get_github(payload):
+    """Pooled PyGithub client for the payload's installation.
+
+    Each installation has its own token and therefore its own rate-limit
+    budget; without a GitHub App every repository shares GITHUB_TOKEN.
+    """
+    installation_id = installation_id_of(payload)
+    token = token_for(payload)
+
+    with _pool_lock:
+        client, client_token = _clients.get(installation_id, (None, None))
+        if client is None or client_token != token:
+            client = Github(auth=Auth.Token(token))
+            _clients[installation_id] = (client, token)
+    return client
+
+
+def rate_limits():
+    """Last seen (remaining, limit) per installation, without making API calls"""
+    with _pool_lock:
+        return {
+            str(installation_id or "token"): client.requester.rate_limiting
+            for installation_id, (client, _) in _clients.items()
+        }
+
+
+def prefetch(payload):
+    """Mint the token for a payload's installation before its job is queued.
+
+    Blocks on the mint for an installation this process has not seen yet
+    (run it off the event loop); from then on the refresher keeps it warm.
+    """
+    installation_id = installation_id_of(payload)
+    if installation_id is None or installation_id in _known:
+        return
+    _known[installation_id] = time.time()
+    _safe_mint(installation_id)
+
+
+def _safe_mint(installation_id):
+    try:
+        _mint(installation_id)
+    except Exception as e:
+        logger.error(f"Failed to mint token for installation {installation_id}: {str(e)}")
+
+
+def _refresh_loop():
+    while not _stop.wait(60):
+        store = get_store()
+        for installation_id, last_used in list(_known.items()):
+            # Stop refreshing installations that have gone quiet for a day
+            if time.time() - last_used > 86400:
+                _known.pop(installation_id, None)
+                continue
+            cached = store.get(f"ghtoken:{installation_id}")
+            if not cached or cached["expires_at"] - time.time() <= TOKEN_REFRESH_MARGIN_SECONDS:
+                _safe_mint(installation_id)
+
+        for name, (remaining, limit) in rate_limits().items():
+            if limit > 0 and remaining < limit * 0.1:
+                logger.warning(f"GitHub rate limit low for installation {name}: {remaining}/{limit}")
+
+
+def start_token_refresher():
+    """Refresh installation tokens in the background, well before they expire"""
+    global _refresher
+    if not GITHUB_APP_ID or _refresher is not None:
+        return
+    _stop.clear()
+    _refresher = threading.Thread(target=_refresh_loop, name="token-refresher", daemon=True)
+    _refresher.start()
+
+
+def stop_token_refresher():
+    global _refresher
+    _stop.set()
+    _refresher = None
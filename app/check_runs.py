@@ -0,0 +1,90 @@
+from app.auth import installation_id_of
+from app.repo_cache import get_repo
+from app import metrics
+from datetime import datetime, timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECK_RUN_NAME = "PR Sentinel"
+# GitHub accepts at most 50 annotations per create/update request
+ANNOTATION_BATCH_SIZE = 50
+MAX_SUMMARY_CHARS = 65000
+
+
+class CheckRunReporter:
+    """Publishes PR progress as a GitHub Check Run, one PATCH per finished stage.
+
+    Check Runs can only be written with a GitHub App token; with a personal
+    token the reporter is a no-op and the PR comment is the only feedback.
+    """
+
+    def __init__(self, gh, payload, head_sha):
+        self.check_run = None
+        self.sections = []
+        self.failed = False
+
+        if installation_id_of(payload) is None:
+            logger.info("Check Runs need a GitHub App installation; skipping")
+            return
+
+        try:
+            repo = get_repo(gh, payload)
+            self.check_run = repo.create_check_run(
+                name=CHECK_RUN_NAME,
+                head_sha=head_sha,
+                status="in_progress",
+                started_at=datetime.now(timezone.utc),
+                output={"title": "Checks running", "summary": "⏳ Cloning repository..."},
+            )
+            metrics.first_feedback()
+            logger.info(f"Created check run {self.check_run.id} for {head_sha}")
+        except Exception as e:
+            logger.error(f"Failed to create check run: {str(e)}")
+
+    def _summary(self):
+        summary = "\n\n".join(self.sections)
+        if len(summary) > MAX_SUMMARY_CHARS:
+            summary = summary[:MAX_SUMMARY_CHARS] + "\n\n… (truncated)"
+        return summary
+
+    def stage(self, name, lines, annotations=(), ok=True):
+        """Report a finished stage, attaching its annotations in batches of 50"""
+        self.failed = self.failed or not ok
+        self.sections.append(f"### {name}\n" + "\n".join(lines))
+        if self.check_run is None:
+            return
+
+        annotations = list(annotations)
+        title = f"Finished {name}"
+        try:
+            # GitHub appends annotations across updates, so each PATCH carries the next batch
+            self.check_run.edit(output={
+                "title": title,
+                "summary": self._summary(),
+                "annotations": annotations[:ANNOTATION_BATCH_SIZE],
+            })
+            for start in range(ANNOTATION_BATCH_SIZE, len(annotations), ANNOTATION_BATCH_SIZE):
+                self.check_run.edit(output={
+                    "title": title,
+                    "summary": self._summary(),
+                    "annotations": annotations[start:start + ANNOTATION_BATCH_SIZE],
+                })
+        except Exception as e:
+            logger.error(f"Failed to update check run for stage {name}: {str(e)}")
+
+    def complete(self, error=None):
+        if self.check_run is None:
+            return
+        if error:
+            self.sections.append(f"❌ **Error:** {error}")
+        try:
+            self.check_run.edit(
+                status="completed",
+                conclusion="failure" if self.failed or error else "success",
+                completed_at=datetime.now(timezone.utc),
+                output={"title": "Checks failed" if self.failed or error else "Checks passed",
+                        "summary": self._summary()},
+            )
+        except Exception as e:
+            logger.error(f"Failed to complete check run: {str(e)}")
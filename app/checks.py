@@ -1,3 +1,15 @@
+from app.config import CHECK_CACHE_TTL_SECONDS
+from app.state import get_store
+from app.lint_pool import ESLINT_CONFIG_FILES, pool as lint_pool
+from app import advisories
+from app import metrics
+from app import proc
+from app.diffs import checkout_diff, lintable_files
+from collections import Counter
+from functools import lru_cache
+import codecs
+import hashlib
+import json
 import subprocess
 import tempfile
 import os
@@ -5,97 +17,409 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def run_checks(clone_url, branch):
+# Bump when a stage's output format or logic changes to invalidate cached results
+CHECKS_CACHE_VERSION = "5"
+
+LOCKFILES = ["package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml"]
+SEVERITY_ORDER = ["critical", "high", "moderate", "medium", "low", "unknown"]
+MAX_LISTED_ADVISORIES = 20
+# Each stage's comment section stays well inside GitHub's 65,536-character comment limit
+MAX_STAGE_CHARS = 20000
+MAX_ANNOTATIONS = 500
+TOP_N = 10
+# Past this many changed files, lint the whole checkout instead of passing each path
+MAX_SCOPED_LINT_FILES = 500
+
+
+@lru_cache(maxsize=1)
+def tool_versions():
+    """Versions of the external tools whose output we cache (resolved once per process)"""
+    versions = {}
+    for tool in ("node", "npm"):
+        try:
+            versions[tool] = subprocess.run(
+                [tool, "--version"], capture_output=True, text=True, timeout=30
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            versions[tool] = "none"
+    return versions
+
+
+def _hash_files(workdir, names):
+    digest = hashlib.sha256()
+    for name in names:
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            digest.update(name.encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def checkout_fingerprint(workdir):
+    """Hashes of the inputs besides the commit that decide check results"""
+    eslint_config = hashlib.sha256(_hash_files(workdir, ESLINT_CONFIG_FILES).encode())
+    package_json = os.path.join(workdir, "package.json")
+    if os.path.exists(package_json):
+        try:
+            with open(package_json) as f:
+                eslint_config.update(json.dumps(json.load(f).get("eslintConfig")).encode())
+        except ValueError:
+            pass
+    return {
+        "eslint_config": eslint_config.hexdigest(),
+        "lockfile": _hash_files(workdir, LOCKFILES),
+    }
+
+
+def _cache_key(head_sha, fingerprint):
+    parts = json.dumps([CHECKS_CACHE_VERSION, fingerprint, tool_versions()], sort_keys=True)
+    return f"checks:{head_sha}:{hashlib.sha256(parts.encode()).hexdigest()[:16]}"
+
+
+def cached_results(head_sha):
+    """Stage results already computed for this commit with the current toolchain"""
+    store = get_store()
+    fingerprint = store.get(f"checks_fp:{head_sha}")
+    if fingerprint is None:
+        return None
+    return store.get(_cache_key(head_sha, fingerprint))
+
+
+def _stage_names(stages):
+    return ["detect"] if "detect" in stages else [name for name in ("lint", "audit") if name in stages]
+
+
+def _stage_order(stages):
+    return [line for name in _stage_names(stages) for line in stages[name]["lines"]]
+
+
+def _stage(lines, annotations=(), ok=True):
+    return {"lines": lines, "annotations": list(annotations), "ok": ok}
+
+
+class EslintReport:
+    """Aggregates ESLint JSON formatter output by rule and file as it streams in.
+
+    feed() takes raw stdout chunks and parses one file result at a time, so
+    only the current file's JSON is buffered. Check Run annotations and
+    sample messages are capped; counts cover everything.
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.errors = 0
+        self.warnings = 0
+        self.by_rule = Counter()
+        self.by_file = Counter()
+        self.annotations = []
+        self.samples = []
+        self.valid = True
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._started = False
+        self._done = False
+
+    def feed(self, data):
+        if self._done or not self.valid:
+            return
+        self._buffer += self._decoder.decode(data)
+        pos = 0
+        while True:
+            while pos < len(self._buffer) and self._buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(self._buffer):
+                break
+            if not self._started:
+                if self._buffer[pos] != "[":
+                    self.valid = False
+                    return
+                self._started = True
+                pos += 1
+                continue
+            if self._buffer[pos] == "]":
+                self._done = True
+                break
+            try:
+                file_result, pos = self._json.raw_decode(self._buffer, pos)
+            except ValueError:
+                # Incomplete element; wait for the next chunk
+                break
+            self.add(file_result)
+        self._buffer = self._buffer[pos:]
+
+    def finish(self):
+        """True if a complete JSON report was parsed"""
+        self.valid = self.valid and self._done
+        return self.valid
+
+    def add(self, file_result):
+        path = os.path.relpath(file_result["filePath"], self.workdir)
+        for message in file_result.get("messages", []):
+            line = message.get("line") or 1
+            rule = message.get("ruleId") or "eslint"
+            level = "failure" if message.get("severity") == 2 else "warning"
+            if level == "failure":
+                self.errors += 1
+            else:
+                self.warnings += 1
+            self.by_rule[rule] += 1
+            self.by_file[path] += 1
+            if len(self.samples) < MAX_ANNOTATIONS:
+                self.samples.append(f"{path}:{line}:{message.get('column') or 1}  {level}  {message['message']}  {rule}")
+                self.annotations.append({
+                    "path": path,
+                    "start_line": line,
+                    "end_line": message.get("endLine") or line,
+                    "annotation_level": level,
+                    "title": rule,
+                    "message": message["message"],
+                })
+
+    def summary(self, budget=MAX_STAGE_CHARS):
+        """Totals, top rules and files, then as many sample messages as fit in budget"""
+        parts = [f"⚠️ **Lint: {self.errors} errors, {self.warnings} warnings in {len(self.by_file)} files.**"]
+        parts.append("| Rule | Problems |\n|---|---|\n" + "\n".join(
+            f"| `{rule}` | {count} |" for rule, count in self.by_rule.most_common(TOP_N)))
+        parts.append("| File | Problems |\n|---|---|\n" + "\n".join(
+            f"| `{path[-120:]}` | {count} |" for path, count in self.by_file.most_common(TOP_N)))
+        text = "\n\n".join(parts)[:budget]
+
+        # Room for the code fence and the "more" line
+        room = budget - len(text) - 64
+        shown = []
+        for sample in self.samples:
+            if len(sample) + 1 > room:
+                break
+            shown.append(sample)
+            room -= len(sample) + 1
+        if shown:
+            text += "\n\n```\n" + "\n".join(shown) + "\n```"
+        hidden = self.errors + self.warnings - len(shown)
+        if hidden > 0 and len(text) + 40 <= budget:
+            text += f"\n… and {hidden} more"
+        return text
+
+
+def tail_block(title, output, budget=MAX_STAGE_CHARS):
+    """Comment section with the end of a command's output"""
+    output = output[-(budget - len(title) - 16):]
+    return f"{title}\n```\n{output}\n```"
+
+
+def _offline_audit_possible(workdir):
+    return advisories.index.version() is not None and advisories.locked_packages(workdir) is not None
+
+
+def audit_stage(workdir, spill_dir):
+    """Audit locked packages against the offline advisory index, falling back to npm audit"""
+    findings = advisories.audit_lockfile(workdir)
+    if findings is not None:
+        metrics.incr("audit.offline")
+        if not findings:
+            return _stage(["✅ No known security vulnerabilities."])
+        findings.sort(key=lambda f: (SEVERITY_ORDER.index(f["severity"]) if f["severity"] in SEVERITY_ORDER
+                                     else len(SEVERITY_ORDER), f["package"]))
+        packages = {(f["package"], f["version"]) for f in findings}
+        lines = [f"🔒 **{len(findings)} known vulnerabilities in {len(packages)} packages.** Run `npm audit fix`."]
+        for f in findings[:MAX_LISTED_ADVISORIES]:
+            lines.append(f"- `{f['package']}@{f['version']}` {f['advisory']} ({f['severity']}): {f['summary']}")
+        if len(findings) > MAX_LISTED_ADVISORIES:
+            lines.append(f"- … and {len(findings) - MAX_LISTED_ADVISORIES} more")
+        return _stage(["\n".join(lines)], ok=False)
+
+    # No index or no lockfile: ask the registry
+    logger.info("Running npm audit...")
+    metrics.incr("audit.npm")
+    audit = proc.run(["npm", "audit", "--json"], cwd=workdir, timeout=120, spill_dir=spill_dir)  # 2 minute timeout
+    try:
+        with audit.open_stdout() as f:
+            report = json.load(f)
+    except ValueError:
+        return _stage([tail_block("⚠️ **npm audit failed:**", audit.stderr_tail)], ok=False)
+    counts = report.get("metadata", {}).get("vulnerabilities") if isinstance(report, dict) else None
+    if not isinstance(counts, dict) or "error" in report:
+        # e.g. {"error": {"code": "ENOLOCK", "summary": ...}}: no result is not a clean result
+        error = report.get("error") if isinstance(report, dict) else None
+        if isinstance(error, dict):
+            error = "\n".join(str(error[k]) for k in ("code", "summary", "detail") if error.get(k))
+        return _stage([tail_block("⚠️ **npm audit failed:**", str(error or audit.stderr_tail))], ok=False)
+    # npm 7+ reports a total; npm 6 only the per-severity counts
+    total = counts.get("total", sum(v for k, v in counts.items() if k != "total"))
+    if total:
+        return _stage([f"🔒 **{total} known vulnerabilities detected.** Run `npm audit fix`."], ok=False)
+    return _stage(["✅ No known security vulnerabilities."])
+
+
+def run_checks(clone_url, branch, head_sha=None, force=False, on_stage=None,
+               base_sha=None, base_clone_url=None, on_diff=None):
+    """Run lint/audit/project detection for a branch, reusing results cached per commit.
+
+    Results are cached per stage under (head SHA, ESLint config hash, lockfile
+    hash, lint scope, tool versions), and the audit stage also by advisory
+    index version; force=True re-runs every stage. on_stage(name, lines,
+    annotations, ok) is called as each stage finishes. With base_sha, the
+    checkout's `git diff base...HEAD` limits ESLint to the changed files and
+    is passed to on_diff(diff_text).
+    """
+    def report(name, stage):
+        if on_stage:
+            on_stage(name, stage["lines"], stage["annotations"], stage["ok"])
+
+    if head_sha and not force:
+        stages = cached_results(head_sha)
+        fresh_audit = stages and stages.get("audit", {}).get("index") == advisories.index.version()
+        if stages and ("detect" in stages or ("lint" in stages and fresh_audit)):
+            logger.info(f"Serving cached check results for {head_sha}")
+            metrics.incr("checks.cache_hit")
+            for name in _stage_names(stages):
+                report(name, stages[name])
+            return _stage_order(stages)
+
+    metrics.incr("checks.cache_miss")
     results = []
-    
+
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
+        with tempfile.TemporaryDirectory() as tmpdir, proc.spill_dir() as spill:
             logger.info(f"Running checks for {clone_url} branch {branch}")
-            
-            # Change to temp directory
-            original_dir = os.getcwd()
-            os.chdir(tmpdir)
-            
-            try:
-                # Clone repository
-                logger.info("Cloning repository...")
-                subprocess.run(
-                    ["git", "clone", "-b", branch, clone_url, "."], 
-                    check=True, 
-                    capture_output=True,
-                    text=True
-                )
-                
-                # Check if package.json exists (Node.js project)
-                if os.path.exists("package.json"):
+
+            # Subprocesses run with cwd=tmpdir; os.chdir is process-wide and
+            # would break checks running concurrently on other lanes
+            logger.info("Cloning repository...")
+            subprocess.run(
+                ["git", "clone", "-b", branch, clone_url, tmpdir],
+                check=True,
+                capture_output=True,
+                text=True
+            )
+
+            # The branch may have moved since the webhook; cache under what we checked out
+            head_sha = subprocess.run(
+                ["git", "rev-parse", "HEAD"], cwd=tmpdir, check=True, capture_output=True, text=True
+            ).stdout.strip()
+
+            report("clone", _stage([f"✅ Checked out `{branch}` at {head_sha[:7]}"]))
+
+            # One diff from the checkout scopes lint and feeds the AI review
+            lint_targets = ["."]
+            if base_sha:
+                try:
+                    diff_text = checkout_diff(tmpdir, base_sha, base_clone_url or clone_url)
+                    if on_diff:
+                        on_diff(diff_text)
+                    lint_targets = lintable_files(diff_text, tmpdir)
+                    if len(lint_targets) > MAX_SCOPED_LINT_FILES:
+                        lint_targets = ["."]
+                except subprocess.SubprocessError as e:
+                    logger.warning(f"Could not diff against {base_sha[:7]}, linting everything: {str(e)}")
+
+            store = get_store()
+            fingerprint = checkout_fingerprint(tmpdir)
+            fingerprint["lint_scope"] = hashlib.sha256(json.dumps(lint_targets).encode()).hexdigest()
+            store.set(f"checks_fp:{head_sha}", fingerprint, ttl=CHECK_CACHE_TTL_SECONDS)
+            cache_key = _cache_key(head_sha, fingerprint)
+            stages = {} if force else store.get(cache_key, {})
+            # Audit results also depend on which advisories the index held
+            index_version = advisories.index.version()
+            if stages.get("audit", {}).get("index") != index_version:
+                stages.pop("audit", None)
+
+            # Check if package.json exists (Node.js project)
+            if os.path.exists(os.path.join(tmpdir, "package.json")):
+                if "lint" not in stages and not lint_targets:
+                    stages["lint"] = _stage(["✅ No changed JavaScript/TypeScript files to lint."])
+                if "lint" not in stages or ("audit" not in stages and not _offline_audit_possible(tmpdir)):
                     # Install dependencies
                     logger.info("Installing npm dependencies...")
-                    install_result = subprocess.run(
-                        ["npm", "install"], 
-                        capture_output=True, 
-                        text=True,
-                        timeout=300  # 5 minute timeout
-                    )
-                    
+                    # Output goes to spill files; only its tail is kept in memory
+                    install_result = proc.run(
+                        ["npm", "install"], cwd=tmpdir, timeout=300, spill_dir=os.path.join(spill, "install")
+                    )  # 5 minute timeout
+
                     if install_result.returncode != 0:
-                        results.append(f"⚠️ **npm install failed:**\n```\n{install_result.stderr}\n```")
+                        failure = tail_block("⚠️ **npm install failed:**", install_result.stderr_tail)
+                        report("install", _stage([failure], ok=False))
+                        results.append(failure)
                         return results
-                    
+                    report("install", _stage(["✅ Dependencies installed"]))
+
+                if "lint" not in stages:
                     # Run ESLint
                     logger.info("Running ESLint...")
-                    lint = subprocess.run(
-                        ["npx", "eslint", "."], 
-                        capture_output=True, 
-                        text=True,
-                        timeout=120  # 2 minute timeout
-                    )
-                    
-                    if lint.returncode != 0:
-                        results.append(f"⚠️ **Lint errors:**\n```\n{lint.stdout}\n```")
-                    else:
-                        results.append("✅ No lint errors.")
-
-                    # Run npm audit
-                    logger.info("Running npm audit...")
-                    audit = subprocess.run(
-                        ["npm", "audit", "--json"], 
-                        capture_output=True, 
-                        text=True,
-                        timeout=120  # 2 minute timeout
-                    )
-                    
-                    if audit.returncode != 0 or '"vulnerabilities"' in audit.stdout:
-                        results.append("🔒 **Security risks detected.** Run `npm audit fix`.")
+                    # The JSON report is parsed as it streams, one file result at a time
+                    lint_report = EslintReport(tmpdir)
+                    lint = None
+                    # A fork's install scripts could patch the ESLint a worker would keep for its repo
+                    repo = base_clone_url or clone_url
+                    warm = lint_pool.lint(tmpdir, fingerprint["eslint_config"], lint_targets, lint_report.feed,
+                                          repo, trusted=repo == clone_url)
+
+                    if not (warm and lint_report.finish()):
+                        if warm:
+                            logger.warning("ESLint worker sent an incomplete report, falling back to npx")
+                        lint_report = EslintReport(tmpdir)
+                        lint = proc.run(
+                            # "--" keeps a changed file named like an option from being read as one
+                            ["npx", "eslint", "--format", "json", "--no-error-on-unmatched-pattern", "--"]
+                            + lint_targets,
+                            cwd=tmpdir,
+                            timeout=120,  # 2 minute timeout
+                            spill_dir=os.path.join(spill, "lint"),
+                            on_stdout=lint_report.feed,
+                        )
+
+                    if lint is not None and not lint_report.finish():
+                        # Exit code 2: ESLint crashed or is misconfigured, no JSON report
+                        output = lint.stdout_tail + lint.stderr_tail
+                        stages["lint"] = _stage([tail_block("⚠️ **Lint errors:**", output)], ok=False)
+                    elif not lint_report.errors:
+                        # ESLint exits 1 only for errors, so warnings alone pass
+                        stages["lint"] = _stage(["✅ No lint errors."])
                     else:
-                        results.append("✅ No known security vulnerabilities.")
+                        stages["lint"] = _stage([lint_report.summary()], lint_report.annotations, ok=False)
+                    store.set(cache_key, stages, ttl=CHECK_CACHE_TTL_SECONDS)
+                report("lint", stages["lint"])
+
+                if "audit" not in stages:
+                    logger.info("Auditing dependencies...")
+                    stages["audit"] = dict(audit_stage(tmpdir, os.path.join(spill, "audit")), index=index_version)
+                    store.set(cache_key, stages, ttl=CHECK_CACHE_TTL_SECONDS)
+                report("audit", stages["audit"])
+            else:
+                # For non-Node.js projects, provide basic checks
+                detect = ["ℹ️ **Non-Node.js project detected.** Basic checks completed."]
+
+                # Check for common files
+                if os.path.exists(os.path.join(tmpdir, "requirements.txt")):
+                    detect.append("✅ Python project detected (requirements.txt found)")
+                elif os.path.exists(os.path.join(tmpdir, "pom.xml")):
+                    detect.append("✅ Java project detected (pom.xml found)")
+                elif os.path.exists(os.path.join(tmpdir, "Gemfile")):
+                    detect.append("✅ Ruby project detected (Gemfile found)")
+                elif os.path.exists(os.path.join(tmpdir, "go.mod")):
+                    detect.append("✅ Go project detected (go.mod found)")
                 else:
-                    # For non-Node.js projects, provide basic checks
-                    results.append("ℹ️ **Non-Node.js project detected.** Basic checks completed.")
-                    
-                    # Check for common files
-                    if os.path.exists("requirements.txt"):
-                        results.append("✅ Python project detected (requirements.txt found)")
-                    elif os.path.exists("pom.xml"):
-                        results.append("✅ Java project detected (pom.xml found)")
-                    elif os.path.exists("Gemfile"):
-                        results.append("✅ Ruby project detected (Gemfile found)")
-                    elif os.path.exists("go.mod"):
-                        results.append("✅ Go project detected (go.mod found)")
-                    else:
-                        results.append("ℹ️ Project type not specifically identified")
-                    
-            finally:
-                # Always return to original directory
-                os.chdir(original_dir)
-                
+                    detect.append("ℹ️ Project type not specifically identified")
+                stages["detect"] = _stage(detect)
+                store.set(cache_key, stages, ttl=CHECK_CACHE_TTL_SECONDS)
+                report("detect", stages["detect"])
+
+            results.extend(_stage_order(stages))
+
     except subprocess.TimeoutExpired:
         logger.error("Check operation timed out")
-        results.append("⏰ **Operation timed out.** Please try again later.")
+        failure = "⏰ **Operation timed out.** Please try again later."
     except subprocess.CalledProcessError as e:
         logger.error(f"Subprocess error: {str(e)}")
-        results.append(f"❌ **Error running checks:** {str(e)}")
+        failure = f"❌ **Error running checks:** {str(e)}"
     except Exception as e:
         logger.error(f"Unexpected error in checks: {str(e)}")
-        results.append(f"❌ **Unexpected error:** {str(e)}")
-    
+        failure = f"❌ **Unexpected error:** {str(e)}"
+    else:
+        return results
+
+    # A clone failure or crash must not leave the check run to conclude success
+    report("error", _stage([failure], ok=False))
+    results.append(failure)
     return results
@@ -0,0 +1,92 @@
+from app.graphql import GraphQLError
+from app.state import get_store
+from app import metrics
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# GitHub rejects comment bodies longer than 65,536 characters
+MAX_COMMENT_CHARS = 65536
+TRUNCATED = "\n\n… (truncated)"
+
+
+def _comment_key(repo_name, number):
+    return f"bot_comment:{repo_name}#{number}"
+
+
+def _truncate(section, limit):
+    if len(section) <= limit:
+        return section
+    cut = section[:max(limit - len(TRUNCATED) - 4, 0)]
+    if cut.count("```") % 2:
+        # Close a code block we cut in half
+        cut += "\n```"
+    return cut + TRUNCATED
+
+
+def fit_comment(sections, limit=MAX_COMMENT_CHARS, separator="\n\n"):
+    """Join comment sections, trimming the largest ones so the body fits in limit"""
+    budget = limit - len(separator) * max(len(sections) - 1, 0)
+    if sum(len(section) for section in sections) <= budget:
+        return separator.join(sections)
+
+    # Short sections keep their text; the rest share what's left equally
+    limits = {}
+    remaining = budget
+    order = sorted(range(len(sections)), key=lambda i: len(sections[i]))
+    for position, index in enumerate(order):
+        share = remaining // (len(order) - position)
+        limits[index] = min(len(sections[index]), share)
+        remaining -= limits[index]
+    return separator.join(_truncate(section, limits[i]) for i, section in enumerate(sections))
+
+
+def upsert_comment(batch, subject_id, repo_name, number, body):
+    """Queue the single bot comment for a PR/issue onto a mutation batch.
+
+    The node id of the comment we created is kept in the state store, so
+    later runs edit it in place without listing comments, and skip the write
+    entirely when the rendered body has not changed. Jobs for one PR never
+    run concurrently, so no lock is needed around the read-modify-write.
+    """
+    store = get_store()
+    key = _comment_key(repo_name, number)
+    digest = hashlib.sha256(body.encode()).hexdigest()
+    saved = store.get(key)
+
+    if saved and saved["digest"] == digest:
+        logger.info(f"Bot comment on {repo_name}#{number} is unchanged, skipping update")
+        metrics.incr("comments.unchanged")
+        return
+
+    def remember(node):
+        store.set(key, {"id": node["databaseId"], "node_id": node["id"], "digest": digest})
+
+    def created(result):
+        remember(result["commentEdge"]["node"])
+        logger.info(f"Created bot comment on {repo_name}#{number}")
+        metrics.incr("comments.created")
+
+    def updated(result):
+        remember(result["issueComment"])
+        logger.info(f"Updated bot comment on {repo_name}#{number}")
+        metrics.incr("comments.updated")
+
+    if saved and saved.get("node_id"):
+        alias = batch.update_comment(saved["node_id"], body)
+        batch.on_success(alias, updated)
+
+        def recreate(errors):
+            if not any(error.get("type") == "NOT_FOUND" for error in errors):
+                raise GraphQLError(errors)
+            # Someone deleted our comment; post a fresh one
+            logger.info(f"Bot comment on {repo_name}#{number} is gone, posting a new one: {errors}")
+            store.delete(key)
+            retry = type(batch)(batch.token)
+            retry.on_success(retry.add_comment(subject_id, body), created)
+            retry.execute()
+
+        batch.on_error(alias, recreate)
+    else:
+        batch.on_success(batch.add_comment(subject_id, body), created)
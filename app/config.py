@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 import os
 import logging
+import tempfile
 
 load_dotenv()
 
@@ -11,10 +12,24 @@ GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# GitHub App authentication (used instead of GITHUB_TOKEN when configured)
+GITHUB_APP_ID = os.getenv("GITHUB_APP_ID")
+GITHUB_APP_PRIVATE_KEY = os.getenv("GITHUB_APP_PRIVATE_KEY")
+GITHUB_APP_PRIVATE_KEY_PATH = os.getenv("GITHUB_APP_PRIVATE_KEY_PATH")
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "600"))
+
+if GITHUB_APP_ID and not GITHUB_APP_PRIVATE_KEY and GITHUB_APP_PRIVATE_KEY_PATH:
+    with open(GITHUB_APP_PRIVATE_KEY_PATH) as key_file:
+        GITHUB_APP_PRIVATE_KEY = key_file.read()
+
 # Validate required environment variables
-if not GITHUB_TOKEN:
-    logger.error("GITHUB_TOKEN environment variable is required")
-    raise ValueError("GITHUB_TOKEN environment variable is required")
+if GITHUB_APP_ID and not GITHUB_APP_PRIVATE_KEY:
+    logger.error("GITHUB_APP_PRIVATE_KEY or GITHUB_APP_PRIVATE_KEY_PATH is required with GITHUB_APP_ID")
+    raise ValueError("GITHUB_APP_PRIVATE_KEY or GITHUB_APP_PRIVATE_KEY_PATH is required with GITHUB_APP_ID")
+
+if not GITHUB_TOKEN and not GITHUB_APP_ID:
+    logger.error("GITHUB_TOKEN (or GITHUB_APP_ID) environment variable is required")
+    raise ValueError("GITHUB_TOKEN (or GITHUB_APP_ID) environment variable is required")
 
 if not WEBHOOK_SECRET:
     logger.error("WEBHOOK_SECRET environment variable is required")
@@ -27,3 +42,37 @@ if not GEMINI_API_KEY:
 GEMINI_URL = (
     "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
 )
+
+# Shared state (dedupe, caches, job queue, locks) for multi-worker serving
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").lower()
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", ".sentinel/state.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REPO_CACHE_SIZE = int(os.getenv("REPO_CACHE_SIZE", "1024"))
+REPO_CACHE_TTL_SECONDS = int(os.getenv("REPO_CACHE_TTL_SECONDS", "3600"))
+# Outside the bot's own tree, so ESLint never finds the bot's config above a toolchain
+LINT_POOL_DIR = os.getenv("LINT_POOL_DIR", os.path.join(tempfile.gettempdir(), "sentinel-lint"))
+LINT_POOL_SIZE = int(os.getenv("LINT_POOL_SIZE", "4"))
+LINT_WORKER_IDLE_SECONDS = int(os.getenv("LINT_WORKER_IDLE_SECONDS", "900"))
+CHECK_CACHE_TTL_SECONDS = int(os.getenv("CHECK_CACHE_TTL_SECONDS", "604800"))
+ADVISORY_DB_PATH = os.getenv("ADVISORY_DB_PATH", ".sentinel/advisories.db")
+ADVISORY_SOURCE = os.getenv("ADVISORY_SOURCE")
+ADVISORY_REFRESH_HOURS = float(os.getenv("ADVISORY_REFRESH_HOURS", "24"))
+SIMILARITY_DB_PATH = os.getenv("SIMILARITY_DB_PATH", ".sentinel/similar.db")
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "900"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+DELIVERY_TTL_SECONDS = int(os.getenv("DELIVERY_TTL_SECONDS", "86400"))
+
+# Keyed execution lanes: jobs for one PR/issue run in order, others in parallel.
+# Each priority class has its own lanes; JOB_LANES sizes the PR checks pool.
+JOB_LANES = int(os.getenv("JOB_LANES", "4"))
+ALERT_LANES = int(os.getenv("ALERT_LANES", "1"))
+REPLY_LANES = int(os.getenv("REPLY_LANES", "2"))
+LANE_CAPACITY = int(os.getenv("LANE_CAPACITY", "8"))
+REPO_MAX_INFLIGHT = int(os.getenv("REPO_MAX_INFLIGHT", "2"))
+
+# Profiling: /debug/profile needs PROFILE_TOKEN; PROFILE_EVERY_N > 0 profiles every Nth job
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_EVERY_N = int(os.getenv("PROFILE_EVERY_N", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".sentinel/profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
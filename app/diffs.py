@@ -0,0 +1,59 @@
+from app.auth import token_for
+from app.metrics import count_github_call
+import logging
+import os
+import requests
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+LINTABLE_EXTENSIONS = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".mts", ".cts")
+
+
+def checkout_diff(workdir, base_sha, base_clone_url):
+    """`git diff base...HEAD` in a checkout, fetching the base commit if the clone lacks it"""
+    present = subprocess.run(
+        ["git", "cat-file", "-e", f"{base_sha}^{{commit}}"], cwd=workdir, capture_output=True
+    )
+    if present.returncode != 0:
+        # Fork PRs: the base commit lives in the upstream repository
+        subprocess.run(
+            ["git", "fetch", "--quiet", base_clone_url, base_sha],
+            cwd=workdir, check=True, capture_output=True, timeout=120,
+        )
+    return subprocess.run(
+        ["git", "diff", f"{base_sha}...HEAD"],
+        cwd=workdir, check=True, capture_output=True, encoding="utf-8", errors="replace", timeout=60,
+    ).stdout
+
+
+def api_diff(payload):
+    """Authenticated PR diff from the REST API, for when there is no checkout"""
+    repo_name = payload["repository"]["full_name"]
+    number = payload["pull_request"]["number"]
+    count_github_call()
+    response = requests.get(
+        f"https://api.github.com/repos/{repo_name}/pulls/{number}",
+        headers={"Authorization": f"Bearer {token_for(payload)}", "Accept": "application/vnd.github.diff"},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.text
+
+
+def changed_files(diff_text):
+    """Paths that exist after the change (added, modified, renamed), in diff order"""
+    paths = []
+    for line in diff_text.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:].strip().strip('"')
+            if path.startswith("b/"):
+                paths.append(path[2:])
+    return paths
+
+
+def lintable_files(diff_text, workdir):
+    return [
+        path for path in changed_files(diff_text)
+        if path.endswith(LINTABLE_EXTENSIONS) and os.path.exists(os.path.join(workdir, path))
+    ]
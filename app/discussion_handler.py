@@ -1,11 +1,11 @@
-from github import Github
-from app.config import GITHUB_TOKEN
-from app.gemini import ai_reply
+from app.auth import token_for
+from app.gemini import REPLY_PREFIX, ai_reply
+from app.graphql import MutationBatch
+from app.similarity import duplicate_reply, index as similar_threads
+from app import metrics
 import logging
-import requests
 
 logger = logging.getLogger(__name__)
-gh = Github(GITHUB_TOKEN)
 
 async def handle_discussion(payload):
     try:
@@ -31,29 +31,28 @@ async def handle_discussion(payload):
         # Combine title and body for AI analysis
         content = f"{discussion_title}\n\n{discussion_body}" if discussion_body else discussion_title
         
-        logger.info("Generating AI reply")
-        reply = ai_reply(content)
+        # Near-duplicates of an earlier thread reuse its answer instead of a new Gemini call
+        duplicate = similar_threads.find(repo_name, content, exclude=discussion_data["number"])
+        if duplicate:
+            logger.info(f"Discussion #{discussion_data['number']} duplicates #{duplicate['number']} ({duplicate['similarity']:.0%})")
+            metrics.incr("duplicates.discussions")
+            metrics.incr("gemini_calls_saved")
+            reply = duplicate_reply(duplicate)
+            answer = duplicate["reply"]
+        else:
+            logger.info("Generating AI reply")
+            reply = answer = ai_reply(content)
 
-        # Comment on the discussion using GitHub API
+        # Discussions are GraphQL-only; there is no REST endpoint for comments
         try:
-            comment_url = f"https://api.github.com/repos/{repo_name}/discussions/{discussion_data['number']}/comments"
-            headers = {
-                "Authorization": f"token {GITHUB_TOKEN}",
-                "Accept": "application/vnd.github.v3+json",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
-                comment_url,
-                headers=headers,
-                json={"body": reply},
-                timeout=30
-            )
-            
-            if response.status_code == 201:
-                logger.info(f"Successfully commented on discussion #{discussion_data['number']}")
-            else:
-                logger.warning(f"Failed to comment on discussion: {response.status_code} - {response.text}")
+            batch = MutationBatch(token_for(payload))
+            batch.add_discussion_comment(discussion_data["node_id"], reply)
+            batch.execute()
+            logger.info(f"Successfully commented on discussion #{discussion_data['number']}")
+
+            if answer.startswith(REPLY_PREFIX):
+                similar_threads.add(repo_name, discussion_data["number"], "discussion",
+                                    discussion_data.get("html_url"), content, answer)
                 
         except Exception as e:
             logger.error(f"Error commenting on discussion: {str(e)}")
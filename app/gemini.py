@@ -4,14 +4,13 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def review_with_gemini(diff_url):
+# Successful replies start with this; error messages do not have the newline
+REPLY_PREFIX = "🤖 **Gemini AI Reply:**\n"
+
+def review_with_gemini(diff_text):
     try:
-        # Fetch diff content
-        diff_response = requests.get(diff_url, timeout=30)
-        diff_response.raise_for_status()
-        diff_text = diff_response.text
-        
-        if not diff_text.strip():
+        # The caller supplies the diff, from the checkout or the API
+        if not diff_text or not diff_text.strip():
             return "🤖 **Gemini AI Review:** No diff content found to review."
         
         payload = {
@@ -71,7 +70,7 @@ def ai_reply(text):
             return "🤖 **Gemini AI Reply:** Unable to generate reply at this time."
             
         reply_text = data["candidates"][0]["content"]["parts"][0]["text"]
-        return "🤖 **Gemini AI Reply:**\n" + reply_text
+        return REPLY_PREFIX + reply_text
         
     except requests.exceptions.RequestException as e:
         logger.error(f"Gemini API request error: {str(e)}")
@@ -1,7 +1,8 @@
-from app.pr_handler import handle_pr
+from app.pr_handler import PR_ACTIONS, handle_pr, handle_pr_command, is_recheck
 from app.issue_handler import handle_issue
 from app.discussion_handler import handle_discussion
 from app.alerts_handler import handle_alerts
+from app.repo_cache import invalidate
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,15 +13,52 @@ async def handle_event(event: str, payload: dict):
         
         if event == "pull_request":
             await handle_pr(payload)
+        elif event == "issue_comment":
+            await handle_pr_command(payload)
         elif event == "issues":
             await handle_issue(payload)
         elif event == "discussion":
             await handle_discussion(payload)
         elif event in ["code_scanning_alert", "secret_scanning_alert", "dependabot_alert"]:
             await handle_alerts(event, payload)
+        elif event == "repository":
+            # Renames, transfers, visibility and settings changes
+            invalidate(payload["repository"]["full_name"])
         else:
             logger.info(f"Unhandled event type: {event}")
             
     except Exception as e:
         logger.error(f"Error handling {event} event: {str(e)}")
         raise
+
+def event_key(event: str, payload: dict):
+    """Ordering key for a job: events for the same PR/issue/discussion share a key"""
+    repo_name = payload.get("repository", {}).get("full_name", "unknown")
+    
+    for field in ("pull_request", "issue", "discussion", "alert"):
+        if field in payload and "number" in payload[field]:
+            return f"{repo_name}#{payload[field]['number']}"
+    
+    return f"{repo_name}#{event}"
+
+def plan_jobs(event: str, payload: dict):
+    """(job event, priority class) pairs to queue for a webhook, in the order they must run.
+
+    Events and actions the handlers would skip get no job at all.
+    """
+    if event in ["code_scanning_alert", "secret_scanning_alert", "dependabot_alert"]:
+        return [(event, "alerts")]
+    if event == "pull_request":
+        # The checks job also reviews the diff from its checkout, alongside install/lint
+        return [(event, "checks")] if payload.get("action", "opened") in PR_ACTIONS else []
+    if event == "issue_comment":
+        # Only an allowed `/sentinel recheck` on a PR re-runs the checks; other comments need no job
+        is_pr = "pull_request" in payload.get("issue", {})
+        return [(event, "checks")] if is_pr and is_recheck(payload) else []
+    if event == "issues":
+        return [(event, "replies")] if payload.get("action", "opened") == "opened" else []
+    if event == "discussion":
+        return [(event, "replies")] if payload.get("action", "created") == "created" else []
+    if event == "repository":
+        return [(event, "replies")]
+    return []
@@ -0,0 +1,171 @@
+from app.metrics import count_github_call
+from app.repo_cache import cached_metadata, forget
+import logging
+import requests
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+
+class GraphQLError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(error.get("message", str(error)) for error in errors))
+
+
+def _post(token, query, variables):
+    count_github_call("graphql")
+    response = requests.post(
+        GRAPHQL_URL,
+        headers={"Authorization": f"bearer {token}"},
+        json={"query": query, "variables": variables},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def graphql(token, query, variables=None):
+    """Run one GraphQL request and return its data, raising GraphQLError on any error"""
+    body = _post(token, query, variables or {})
+    if body.get("errors"):
+        raise GraphQLError(body["errors"])
+    return body["data"]
+
+
+class MutationBatch:
+    """Collects every write for one event and sends them as a single aliased mutation.
+
+    Each queued mutation gets an alias (m0, m1, ...); callbacks registered with
+    on_success/on_error receive that alias's result once execute() has run.
+    An on_error callback that raises GraphQLError hands those errors back, and
+    execute() raises them with any other unhandled errors.
+    """
+
+    def __init__(self, token):
+        self.token = token
+        self.mutations = []
+        self.callbacks = {}
+
+    def _add(self, field, input_type, input_value, selection):
+        alias = f"m{len(self.mutations)}"
+        self.mutations.append((alias, field, input_type, input_value, selection))
+        return alias
+
+    def add_comment(self, subject_id, body):
+        return self._add("addComment", "AddCommentInput", {"subjectId": subject_id, "body": body},
+                         "commentEdge { node { id databaseId } }")
+
+    def update_comment(self, comment_id, body):
+        return self._add("updateIssueComment", "UpdateIssueCommentInput", {"id": comment_id, "body": body},
+                         "issueComment { id databaseId }")
+
+    def add_discussion_comment(self, discussion_id, body):
+        return self._add("addDiscussionComment", "AddDiscussionCommentInput",
+                         {"discussionId": discussion_id, "body": body}, "comment { id databaseId }")
+
+    def add_labels(self, labelable_id, label_ids):
+        return self._add("addLabelsToLabelable", "AddLabelsToLabelableInput",
+                         {"labelableId": labelable_id, "labelIds": label_ids}, "clientMutationId")
+
+    def close_issue(self, issue_id):
+        return self._add("closeIssue", "CloseIssueInput", {"issueId": issue_id}, "issue { id }")
+
+    def close_pull_request(self, pull_request_id):
+        return self._add("closePullRequest", "ClosePullRequestInput", {"pullRequestId": pull_request_id},
+                         "pullRequest { id }")
+
+    def on_success(self, alias, callback):
+        self.callbacks.setdefault(alias, {})["success"] = callback
+
+    def on_error(self, alias, callback):
+        self.callbacks.setdefault(alias, {})["error"] = callback
+
+    def __len__(self):
+        return len(self.mutations)
+
+    def execute(self):
+        """Send all queued mutations in one round trip; returns {alias: result}"""
+        if not self.mutations:
+            return {}
+
+        variables = {}
+        params = []
+        fields = []
+        for alias, field, input_type, input_value, selection in self.mutations:
+            variables[alias] = input_value
+            params.append(f"${alias}: {input_type}!")
+            fields.append(f"{alias}: {field}(input: ${alias}) {{ {selection} }}")
+        query = f"mutation({', '.join(params)}) {{ {' '.join(fields)} }}"
+
+        body = _post(self.token, query, variables)
+        data = body.get("data") or {}
+
+        # Errors are reported per alias through the first element of their path
+        errors = {}
+        for error in body.get("errors", []):
+            path = error.get("path") or [None]
+            errors.setdefault(path[0], []).append(error)
+
+        unhandled = errors.pop(None, [])
+        for alias, *_ in self.mutations:
+            callbacks = self.callbacks.get(alias, {})
+            if alias in errors:
+                if "error" in callbacks:
+                    try:
+                        callbacks["error"](errors[alias])
+                    except GraphQLError as e:
+                        unhandled.extend(e.errors)
+                else:
+                    unhandled.extend(errors[alias])
+            elif "success" in callbacks:
+                callbacks["success"](data.get(alias))
+
+        self.mutations = []
+        self.callbacks = {}
+        if unhandled:
+            raise GraphQLError(unhandled)
+        return data
+
+
+_LABELS_QUERY = """
+query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    labels(first: 100) { nodes { id name } }
+  }
+}
+"""
+
+
+def fetch_label_ids(token, repo_name):
+    owner, name = repo_name.split("/", 1)
+    data = graphql(token, _LABELS_QUERY, {"owner": owner, "name": name})
+    return {node["name"]: node["id"] for node in data["repository"]["labels"]["nodes"]}
+
+
+def queue_labels(batch, target, repo_name, names):
+    """Queue labels on batch using cached label ids.
+
+    GraphQL cannot create labels, so a label the repository does not have yet
+    is added over REST (which creates it) and the id cache is refreshed.
+    """
+    ids = cached_metadata(repo_name, "labels", lambda: fetch_label_ids(batch.token, repo_name))
+    if all(name in ids for name in names):
+        alias = batch.add_labels(target.raw_data["node_id"], [ids[name] for name in names])
+
+        def stale(errors):
+            # A cached id can outlive a deleted or recreated label
+            logger.info(f"Label ids for {repo_name} are stale, adding {names} over REST: {errors}")
+            forget(repo_name, "labels")
+            try:
+                target.add_to_labels(*names)
+            except Exception as e:
+                logger.error(f"Failed to add label(s) {names} in {repo_name}: {str(e)}")
+
+        batch.on_error(alias, stale)
+        return
+
+    logger.info(f"Creating missing label(s) {names} in {repo_name}")
+    target.add_to_labels(*names)
+    forget(repo_name, "labels")
@@ -1,10 +1,12 @@
-from github import Github
-from app.config import GITHUB_TOKEN
-from app.gemini import ai_reply
+from app.auth import get_github, token_for
+from app.graphql import GraphQLError, MutationBatch, queue_labels
+from app.repo_cache import get_issue
+from app.gemini import REPLY_PREFIX, ai_reply
+from app.similarity import duplicate_reply, index as similar_threads
+from app import metrics
 import logging
 
 logger = logging.getLogger(__name__)
-gh = Github(GITHUB_TOKEN)
 
 async def handle_issue(payload):
     try:
@@ -19,25 +21,45 @@ async def handle_issue(payload):
         
         logger.info(f"Processing issue #{issue_data['number']} in {repo_name}")
         
-        repo = gh.get_repo(repo_name)
-        issue = repo.get_issue(issue_data["number"])
+        issue = get_issue(get_github(payload), payload)
+        batch = MutationBatch(token_for(payload))
 
         # Combine title and body for AI analysis
         content = f"{issue.title}\n\n{issue.body}" if issue.body else issue.title
         
-        logger.info("Generating AI reply")
-        reply = ai_reply(content)
+        # Near-duplicates of an earlier thread reuse its answer instead of a new Gemini call
+        duplicate = similar_threads.find(repo_name, content, exclude=issue.number)
+        if duplicate:
+            logger.info(f"Issue #{issue_data['number']} duplicates #{duplicate['number']} ({duplicate['similarity']:.0%})")
+            metrics.incr("duplicates.issues")
+            metrics.incr("gemini_calls_saved")
+            reply = duplicate_reply(duplicate)
+            answer = duplicate["reply"]
+        else:
+            logger.info("Generating AI reply")
+            reply = answer = ai_reply(content)
 
-        logger.info("Posting comment to issue")
-        issue.create_comment(reply)
+        batch.add_comment(issue_data["node_id"], reply)
         
         # Check if issue should be closed (spam, unnecessary, etc.)
         if should_close_issue(issue.title, issue.body):
             logger.info(f"Closing issue #{issue_data['number']} - identified as spam/unnecessary")
-            issue.create_comment("🤖 **Auto-closing:** This issue appears to be spam or unnecessary. If this was closed in error, please reopen with more details.")
-            issue.edit(state="closed")
+            batch.add_comment(issue_data["node_id"], "🤖 **Auto-closing:** This issue appears to be spam or unnecessary. If this was closed in error, please reopen with more details.")
+            batch.close_issue(issue_data["node_id"])
         else:
-            issue.add_to_labels("triage")
+            queue_labels(batch, issue, repo_name, ["triage"])
+        
+        # Reply, close/label go out in one GraphQL round trip
+        logger.info("Posting comment to issue")
+        try:
+            batch.execute()
+        except GraphQLError as e:
+            # Some writes went through; a second error comment would only add noise
+            logger.error(f"Failed to update issue #{issue_data['number']}: {str(e)}")
+            return
+
+        if answer.startswith(REPLY_PREFIX) and not should_close_issue(issue.title, issue.body):
+            similar_threads.add(repo_name, issue.number, "issue", issue_data.get("html_url"), content, answer)
         
         logger.info(f"Successfully processed issue #{issue_data['number']}")
         
@@ -45,11 +67,9 @@ async def handle_issue(payload):
         logger.error(f"Error processing issue: {str(e)}")
         # Try to post error comment to issue
         try:
-            issue_data = payload["issue"]
-            repo_name = payload["repository"]["full_name"]
-            repo = gh.get_repo(repo_name)
-            issue = repo.get_issue(issue_data["number"])
-            issue.create_comment(f"❌ **Error processing issue:** {str(e)}")
+            batch = MutationBatch(token_for(payload))
+            batch.add_comment(payload["issue"]["node_id"], f"❌ **Error processing issue:** {str(e)}")
+            batch.execute()
         except:
             logger.error("Failed to post error comment to issue")
 
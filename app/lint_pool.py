@@ -0,0 +1,317 @@
+from app.config import LINT_POOL_DIR, LINT_POOL_SIZE, LINT_WORKER_IDLE_SECONDS
+from app import metrics
+import atexit
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "lint_worker.js")
+
+ESLINT_CONFIG_FILES = [
+    "eslint.config.js", "eslint.config.mjs", "eslint.config.cjs", "eslint.config.ts",
+    ".eslintrc", ".eslintrc.js", ".eslintrc.cjs", ".eslintrc.json", ".eslintrc.yml", ".eslintrc.yaml",
+    ".eslintignore",
+]
+# Root config files in the order ESLint picks them, for each config system
+FLAT_CONFIG_FILES = ["eslint.config.js", "eslint.config.mjs", "eslint.config.cjs", "eslint.config.ts"]
+ESLINTRC_FILES = [".eslintrc.js", ".eslintrc.cjs", ".eslintrc.yaml", ".eslintrc.yml", ".eslintrc.json", ".eslintrc"]
+
+
+class LintWorkerError(Exception):
+    pass
+
+
+def _read_version(package_dir):
+    try:
+        with open(os.path.join(package_dir, "package.json")) as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def _eslint_config_in_package_json(path):
+    try:
+        with open(path) as f:
+            return "eslintConfig" in json.load(f)
+    except (OSError, ValueError, TypeError):
+        return False
+
+
+def root_configs(workdir):
+    """(flat config, eslintrc config) file names at the checkout root, "" where there is none"""
+    flat = next((name for name in FLAT_CONFIG_FILES if os.path.isfile(os.path.join(workdir, name))), "")
+    eslintrc = next((name for name in ESLINTRC_FILES if os.path.isfile(os.path.join(workdir, name))), "")
+    if not eslintrc and _eslint_config_in_package_json(os.path.join(workdir, "package.json")):
+        eslintrc = "package.json"
+    return flat, eslintrc
+
+
+def has_nested_config(workdir):
+    """True if a subdirectory has its own ESLint config, which a worker would not see"""
+    names = set(FLAT_CONFIG_FILES + ESLINTRC_FILES)
+    for root, dirs, files in os.walk(workdir):
+        dirs[:] = [d for d in dirs if d not in ("node_modules", ".git")]
+        if root == workdir:
+            continue
+        if names.intersection(files):
+            return True
+        if "package.json" in files and _eslint_config_in_package_json(os.path.join(root, "package.json")):
+            return True
+    return False
+
+
+def toolchain_key(workdir, eslint_config_hash, repo):
+    """Key a worker by repo and ESLint config plus the installed ESLint, plugin, config and parser versions"""
+    node_modules = os.path.join(workdir, "node_modules")
+    versions = {}
+    for entry in sorted(os.listdir(node_modules)):
+        if entry.startswith("@"):
+            scoped = os.path.join(node_modules, entry)
+            names = [f"{entry}/{sub}" for sub in sorted(os.listdir(scoped))] if os.path.isdir(scoped) else []
+        else:
+            names = [entry]
+        for name in names:
+            if "eslint" in name:
+                versions[name] = _read_version(os.path.join(node_modules, name))
+    digest = hashlib.sha256(json.dumps([repo, eslint_config_hash, versions], sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+class LintWorker:
+    def __init__(self, key, toolchain_dir, configs):
+        self.key = key
+        self.toolchain_dir = toolchain_dir
+        self.socket_path = os.path.join(tempfile.gettempdir(), f"sentinel-lint-{os.getpid()}-{key}.sock")
+        self.last_used = time.time()
+        self.proc = subprocess.Popen(
+            ["node", WORKER_SCRIPT, self.socket_path, os.path.join(toolchain_dir, "node_modules", "eslint"), *configs],
+            cwd=toolchain_dir,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        # The worker prints "ready" once ESLint is loaded and the socket is listening
+        if self.proc.stdout.readline().strip() != "ready":
+            self.stop()
+            raise LintWorkerError("ESLint worker failed to start")
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def lint(self, cwd, files, timeout, on_chunk):
+        """Stream the worker's JSON array of file results to on_chunk as it arrives"""
+        self.last_used = time.time()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(self.socket_path)
+            conn.sendall((json.dumps({"cwd": cwd, "files": files}) + "\n").encode())
+            head = b""
+            for chunk in iter(lambda: conn.recv(65536), b""):
+                if head is not None:
+                    # Anything but an array is an error object, which is small
+                    head += chunk
+                    if not head.strip() or head.lstrip()[:1] == b"{":
+                        continue
+                    chunk, head = head, None
+                try:
+                    on_chunk(chunk)
+                except Exception as e:
+                    raise LintWorkerError(f"Output parser failed: {str(e)}")
+        self.last_used = time.time()
+
+        if head is not None:
+            response = json.loads(head or b"{}")
+            raise LintWorkerError(response.get("error", "empty response from ESLint worker"))
+
+    def stop(self):
+        if self.alive():
+            self.proc.terminate()
+            try:
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+class LintPool:
+    """Pool of warm ESLint workers (eslint_d style), one per toolchain key.
+
+    A cold start hard-links the job's node_modules into a toolchain directory
+    owned by this process, so the worker keeps running after the job's
+    checkout is deleted. Idle workers are recycled after
+    LINT_WORKER_IDLE_SECONDS, and at most LINT_POOL_SIZE are kept; a
+    retired worker's toolchain directory is deleted with it.
+
+    The versions in a key don't cover file contents, and a PR's install
+    scripts can patch node_modules, so workers are per repo and only a
+    trusted tree (a branch of the repo itself, not a fork) may start one.
+    """
+
+    def __init__(self, pool_dir, size, idle_seconds):
+        self.pool_dir = pool_dir
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.swept = False
+
+    def _toolchain_dir(self, key, workdir):
+        # Per process, so retiring a worker never deletes files another process's worker uses
+        toolchain_dir = os.path.join(self.pool_dir, f"{os.getpid()}-{key}")
+        shutil.rmtree(toolchain_dir, ignore_errors=True)
+        os.makedirs(toolchain_dir)
+        try:
+            shutil.copytree(os.path.join(workdir, "node_modules"), os.path.join(toolchain_dir, "node_modules"),
+                            symlinks=True, copy_function=os.link)
+        except OSError:
+            # Hard links need the same filesystem; fall back to a real copy
+            shutil.rmtree(os.path.join(toolchain_dir, "node_modules"), ignore_errors=True)
+            shutil.copytree(os.path.join(workdir, "node_modules"), os.path.join(toolchain_dir, "node_modules"),
+                            symlinks=True)
+        # The key covers the root config, so the worker loads it (and its plugins) once from here.
+        # package.json carries `eslintConfig` and the module type of eslint.config.js.
+        for name in ESLINT_CONFIG_FILES + ["package.json"]:
+            if os.path.isfile(os.path.join(workdir, name)):
+                shutil.copy2(os.path.join(workdir, name), os.path.join(toolchain_dir, name))
+        return toolchain_dir
+
+    def _sweep(self):
+        """Delete toolchain directories left behind by processes that are gone"""
+        self.swept = True
+        try:
+            entries = os.listdir(self.pool_dir)
+        except OSError:
+            return
+        for entry in entries:
+            pid = entry.split("-", 1)[0]
+            if pid.isdigit():
+                if int(pid) == os.getpid():
+                    continue
+                try:
+                    os.kill(int(pid), 0)
+                    continue
+                except PermissionError:
+                    continue
+                except OSError:
+                    pass
+            logger.info(f"Removing stale ESLint toolchain {entry}")
+            shutil.rmtree(os.path.join(self.pool_dir, entry), ignore_errors=True)
+
+    def _retire(self, worker):
+        worker.stop()
+        shutil.rmtree(worker.toolchain_dir, ignore_errors=True)
+
+    def _reap_locked(self):
+        now = time.time()
+        for key, worker in list(self.workers.items()):
+            if not worker.alive() or now - worker.last_used > self.idle_seconds:
+                logger.info(f"Recycling idle ESLint worker {key}")
+                self._retire(worker)
+                del self.workers[key]
+
+    def _evict(self):
+        self._reap_locked()
+        while len(self.workers) >= self.size:
+            key = min(self.workers, key=lambda k: self.workers[k].last_used)
+            self._retire(self.workers.pop(key))
+
+    def _worker(self, key, workdir, configs, trusted):
+        with self.lock:
+            worker = self.workers.get(key)
+            if worker and worker.alive():
+                metrics.incr("lint_pool.warm")
+                return worker
+            if not trusted:
+                metrics.incr("lint_pool.untrusted")
+                return None
+
+            if worker:
+                # Crashed since it was last used
+                self._retire(self.workers.pop(key))
+            self._evict()
+            if not self.swept:
+                self._sweep()
+            _start_reaper()
+            logger.info(f"Starting ESLint worker {key}")
+            metrics.incr("lint_pool.cold")
+            toolchain_dir = self._toolchain_dir(key, workdir)
+            try:
+                worker = LintWorker(key, toolchain_dir, configs)
+            except Exception:
+                shutil.rmtree(toolchain_dir, ignore_errors=True)
+                raise
+            self.workers[key] = worker
+            return worker
+
+    def lint(self, workdir, eslint_config_hash, files, on_chunk, repo, trusted, timeout=120):
+        """Lint files in workdir on a warm worker, streaming its ESLint JSON output to on_chunk.
+
+        Returns False when no warm worker can be used. Workers lint the given
+        files, not directories, with only the checkout's root config. A
+        whole-checkout lint needs ESLint's own file discovery, and nested
+        configs need its cascade, so those go to npx, as does a checkout with
+        no config of its own. An untrusted tree only uses a worker its repo
+        already has running.
+        """
+        if shutil.which("node") is None or not os.path.isdir(os.path.join(workdir, "node_modules", "eslint")):
+            return False
+        if any(os.path.isdir(os.path.join(workdir, path)) for path in files):
+            return False
+        configs = root_configs(workdir)
+        if not any(configs) or has_nested_config(workdir):
+            return False
+        try:
+            key = toolchain_key(workdir, eslint_config_hash, repo)
+            worker = self._worker(key, workdir, configs, trusted)
+            if worker is None:
+                logger.info(f"Not starting an ESLint worker from an untrusted checkout of {repo}")
+                return False
+            worker.lint(workdir, list(files), timeout, on_chunk)
+            return True
+        except (OSError, ValueError, LintWorkerError) as e:
+            logger.warning(f"ESLint worker unavailable, falling back to npx: {str(e)}")
+            metrics.incr("lint_pool.fallback")
+            return False
+
+    def reap(self):
+        with self.lock:
+            self._reap_locked()
+
+    def shutdown(self):
+        with self.lock:
+            for worker in self.workers.values():
+                self._retire(worker)
+            self.workers.clear()
+
+
+_reaper = None
+
+
+def _reap_loop():
+    while True:
+        time.sleep(60)
+        pool.reap()
+
+
+def _start_reaper():
+    global _reaper
+    if _reaper is None:
+        _reaper = threading.Thread(target=_reap_loop, name="lint-pool-reaper", daemon=True)
+        _reaper.start()
+
+
+pool = LintPool(LINT_POOL_DIR, LINT_POOL_SIZE, LINT_WORKER_IDLE_SECONDS)
+atexit.register(pool.shutdown)
@@ -0,0 +1,127 @@
+// Long-lived ESLint worker managed by app/lint_pool.py.
+//
+// Runs in the pool's toolchain directory, which holds node_modules and the
+// ESLint config shared by every checkout with this worker's key. ESLint,
+// its config and plugins are loaded once, from there, and reused for every
+// request. Only the checkout's root config is used (passed as file names
+// for flat config and eslintrc), so configs in the directories above the
+// toolchain never leak in. Requests come over a Unix socket as one line of JSON
+// {"cwd": ..., "files": [...]}. The reply is the ESLint JSON formatter's
+// bare array, written one file result at a time as each file is linted, or
+// {"error": "..."} if linting fails before the first result.
+'use strict';
+
+const fs = require('fs');
+const net = require('net');
+const path = require('path');
+
+const [socketPath, eslintDir, flatConfig, eslintrcConfig] = process.argv.slice(2);
+const toolchainDir = process.cwd();
+const eslintModule = require(eslintDir);
+
+let eslintPromise = null;
+
+async function createESLint() {
+  // loadESLint picks flat config or eslintrc the same way the CLI does
+  const ESLintClass = eslintModule.loadESLint
+    ? await eslintModule.loadESLint({ cwd: toolchainDir })
+    : eslintModule.ESLint;
+  const options = { cwd: toolchainDir };
+  if (ESLintClass.configType === 'flat') {
+    if (!flatConfig) {
+      throw new Error('No flat config at the checkout root');
+    }
+    options.overrideConfigFile = path.join(toolchainDir, flatConfig);
+  } else {
+    if (!eslintrcConfig) {
+      throw new Error('No eslintrc config at the checkout root');
+    }
+    // Don't cascade into the parent directories' configs
+    options.useEslintrc = false;
+    options.overrideConfigFile = path.join(toolchainDir, eslintrcConfig);
+    options.resolvePluginsRelativeTo = toolchainDir;
+  }
+  return new ESLintClass(options);
+}
+
+function write(conn, data) {
+  if (conn.write(data)) {
+    return Promise.resolve();
+  }
+  // Wait for the socket to drain, so a slow reader bounds our buffering too
+  return new Promise((resolve) => {
+    const done = () => {
+      conn.off('drain', done);
+      conn.off('close', done);
+      resolve();
+    };
+    conn.on('drain', done);
+    conn.on('close', done);
+  });
+}
+
+async function lint(conn, { cwd, files }) {
+  if (!eslintPromise) {
+    eslintPromise = createESLint();
+  }
+  const eslint = await eslintPromise;
+  let started = false;
+  for (const file of files) {
+    let text;
+    try {
+      text = fs.readFileSync(path.resolve(cwd, file), 'utf8');
+    } catch (err) {
+      continue;
+    }
+    // Lint under the same relative path in the toolchain directory, so config
+    // globs and ignore patterns match as they would in the checkout
+    const fileResults = await eslint.lintText(text, {
+      filePath: path.join(toolchainDir, file),
+      warnIgnored: false,
+    });
+    for (const result of fileResults) {
+      result.filePath = path.resolve(cwd, file);
+      await write(conn, (started ? ',' : '[') + JSON.stringify(result));
+      started = true;
+    }
+    if (conn.destroyed) {
+      // The reader gave up (timeout); stop linting for it
+      return;
+    }
+  }
+  conn.end(started ? ']\n' : '[]\n');
+}
+
+const server = net.createServer((conn) => {
+  let buffer = '';
+  conn.setEncoding('utf8');
+  conn.on('data', async (chunk) => {
+    buffer += chunk;
+    const newline = buffer.indexOf('\n');
+    if (newline === -1) {
+      return;
+    }
+    const line = buffer.slice(0, newline);
+    buffer = '';
+    try {
+      await lint(conn, JSON.parse(line));
+    } catch (err) {
+      if (conn.bytesWritten === 0) {
+        conn.end(JSON.stringify({ error: String((err && err.stack) || err) }) + '\n');
+      } else {
+        // Part of the array is out; cutting it short makes the reader discard it
+        conn.destroy();
+      }
+    }
+  });
+});
+
+try {
+  fs.unlinkSync(socketPath);
+} catch (err) {
+  // No stale socket to clean up
+}
+
+server.listen(socketPath, () => process.stdout.write('ready\n'));
+
+process.on('SIGTERM', () => server.close(() => process.exit(0)));
@@ -1,7 +1,18 @@
 from fastapi import FastAPI, Request, Header, HTTPException
-from app.config import WEBHOOK_SECRET
+from fastapi.responses import PlainTextResponse
+from app.config import WEBHOOK_SECRET, DELIVERY_TTL_SECONDS, PROFILE_TOKEN
 from app.utils import verify_signature
-from app.github import handle_event
+from app.github import event_key, plan_jobs
+from app.auth import prefetch, rate_limits, start_token_refresher, stop_token_refresher
+from app.state import get_store
+from app.scheduler import priority_of
+from app.advisories import start_refresher as start_advisory_refresher
+from app.worker import start_workers, stop_workers
+from app import metrics
+from app import profiler
+import asyncio
+import hmac
+import threading
 import logging
 import sys
 
@@ -15,16 +26,64 @@ async def startup_event():
     try:
         from app.config import GITHUB_TOKEN, WEBHOOK_SECRET, GEMINI_API_KEY
         logger.info("✅ Configuration validated successfully")
+        get_store()
+        start_token_refresher()
+        start_advisory_refresher()
+        start_workers()
         logger.info("🚀 PR Sentinel is ready to receive webhooks!")
     except ValueError as e:
         logger.error(f"❌ Configuration error: {e}")
         sys.exit(1)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the job consumer so in-flight jobs can finish"""
+    await asyncio.to_thread(stop_workers)
+    stop_token_refresher()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "PR Sentinel"}
 
+@app.get("/metrics")
+async def metrics_snapshot():
+    """Counters shared by all workers, including GitHub calls per event type"""
+    return await asyncio.to_thread(metrics.snapshot)
+
+@app.get("/ratelimits")
+async def rate_limit_status():
+    """Remaining GitHub API budget per installation, as of the last response"""
+    return {
+        name: {"remaining": remaining, "limit": limit}
+        for name, (remaining, limit) in rate_limits().items()
+    }
+
+_profile_lock = threading.Lock()
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(seconds: float = 10, mode: str = "wall", interval_ms: float = 10,
+                        authorization: str = Header(None)):
+    """Sample this worker process's stacks for N seconds and return them collapsed for a flamegraph"""
+    # Disabled unless PROFILE_TOKEN is set; callers send it as a bearer token
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorization or not hmac.compare_digest(authorization, f"Bearer {PROFILE_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid profile token")
+    if mode not in ("wall", "cpu") or not 0 < seconds <= 120 or not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="mode must be wall or cpu, seconds 0-120, interval_ms 1-1000")
+    if mode == "cpu" and not profiler.cpu_mode_supported():
+        raise HTTPException(status_code=400, detail="CPU mode needs per-thread CPU times from /proc")
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    try:
+        logger.info(f"Profiling for {seconds}s ({mode})")
+        stacks = await asyncio.to_thread(profiler.sample, seconds, interval_ms / 1000, mode)
+        return profiler.collapse(stacks)
+    finally:
+        _profile_lock.release()
+
 @app.get("/")
 async def root():
     """Root endpoint with basic info"""
@@ -33,6 +92,9 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
+            "ratelimits": "/ratelimits",
+            "profile": "/debug/profile",
             "webhook": "/webhook"
         }
     }
@@ -58,10 +120,38 @@ async def webhook(request: Request, x_hub_signature_256: str = Header(None)):
             logger.warning("Missing GitHub event header")
             raise HTTPException(status_code=400, detail="Missing GitHub event")
 
-        logger.info(f"Processing {event} event")
-        await handle_event(event, payload)
+        jobs = plan_jobs(event, payload)
+        if not jobs:
+            logger.info(f"Ignoring {event} event (action: {payload.get('action')})")
+            return {"status": "ignored"}
+
+        store = get_store()
+        
+        # GitHub redelivers on timeouts; each delivery is processed once across all workers
+        delivery = request.headers.get("x-github-delivery")
+        if delivery:
+            is_new = await asyncio.to_thread(
+                store.add_if_absent, f"delivery:{delivery}", 1, DELIVERY_TTL_SECONDS
+            )
+            if not is_new:
+                logger.info(f"Skipping duplicate delivery {delivery}")
+                return {"status": "duplicate"}
+
+        # Mint an unknown installation's token now, so no job waits on a cold mint
+        await asyncio.to_thread(prefetch, payload)
+
+        key = event_key(event, payload)
+        try:
+            for job_event, job_class in jobs:
+                logger.info(f"Queueing {job_event} job ({job_class}) for {key}")
+                await asyncio.to_thread(store.enqueue, key, job_event, payload, delivery, priority_of(job_class))
+        except Exception:
+            # Let GitHub's redelivery through instead of dropping it as a duplicate
+            if delivery:
+                await asyncio.to_thread(store.delete, f"delivery:{delivery}")
+            raise
 
-        return {"status": "ok"}
+        return {"status": "queued"}
         
     except Exception as e:
         logger.error(f"Webhook processing error: {str(e)}")
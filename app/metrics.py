@@ -0,0 +1,131 @@
+from app.state import get_store
+from contextlib import contextmanager
+from contextvars import ContextVar
+from github.Requester import Requester
+import functools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Event type and receipt time of the job running in the current thread/task
+_current_event = ContextVar("current_event", default=None)
+_current_scope = ContextVar("current_scope", default=None)
+
+
+def incr(name, amount=1):
+    """Add to a counter shared by every worker process"""
+    try:
+        get_store().incr(f"metric:{name}", amount)
+    except Exception as e:
+        logger.warning(f"Failed to record metric {name}: {str(e)}")
+
+
+def observe(name, value):
+    """Record one sample of a timing/size metric as count, sum and max"""
+    incr(f"{name}.count")
+    incr(f"{name}.sum", float(value))
+    try:
+        store = get_store()
+        key = f"metric:{name}.max"
+        if value > store.get(key, 0):
+            store.set(key, value)
+    except Exception as e:
+        logger.warning(f"Failed to record metric {name}: {str(e)}")
+
+
+@contextmanager
+def event_scope(event, received_at=None):
+    """Attribute GitHub calls made inside the block to an event type"""
+    token = _current_event.set(event)
+    scope_token = _current_scope.set({"received_at": received_at, "feedback_sent": False})
+    incr(f"events.{event}")
+    try:
+        yield
+    finally:
+        _current_scope.reset(scope_token)
+        _current_event.reset(token)
+
+
+def first_feedback():
+    """Record time-to-first-feedback once per event: webhook receipt to first visible output"""
+    scope = _current_scope.get()
+    if not scope or scope["feedback_sent"] or scope["received_at"] is None:
+        return
+    scope["feedback_sent"] = True
+    observe(f"time_to_first_feedback_seconds.{current_event()}", time.time() - scope["received_at"])
+
+
+def current_event():
+    return _current_event.get()
+
+
+def count_github_call(kind="rest"):
+    incr(f"github_calls.{current_event() or 'none'}")
+    incr(f"github_calls.{kind}")
+
+
+def snapshot():
+    """All counters, plus the average number of GitHub calls per event type"""
+    raw = get_store().items("metric:")
+    counters = {key[len("metric:"):]: value for key, value in sorted(raw.items())}
+
+    per_event = {}
+    for name, value in counters.items():
+        if name.startswith("events."):
+            event = name[len("events."):]
+            calls = counters.get(f"github_calls.{event}", 0)
+            per_event[event] = round(calls / value, 2) if value else 0
+
+    warm = counters.get("lint_pool.warm", 0)
+    cold = counters.get("lint_pool.cold", 0)
+    lint_pool = {"warm": warm, "cold": cold, "warm_rate": round(warm / (warm + cold), 3) if warm + cold else None}
+
+    # Average and worst time jobs waited in the queue, per priority class
+    queue_wait = {}
+    for name, value in counters.items():
+        if name.startswith("queue_wait_seconds.") and name.endswith(".count") and value:
+            job_class = name[len("queue_wait_seconds."):-len(".count")]
+            queue_wait[job_class] = {
+                "avg": round(counters.get(f"queue_wait_seconds.{job_class}.sum", 0) / value, 3),
+                "max": round(counters.get(f"queue_wait_seconds.{job_class}.max", 0), 3),
+            }
+
+    duplicates = {
+        "issues": counters.get("duplicates.issues", 0),
+        "discussions": counters.get("duplicates.discussions", 0),
+        "gemini_calls_saved": counters.get("gemini_calls_saved", 0),
+    }
+
+    return {
+        "counters": counters,
+        "github_calls_per_event": per_event,
+        "lint_pool": lint_pool,
+        "queue_wait_seconds": queue_wait,
+        "duplicates": duplicates,
+    }
+
+
+def _counted(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        count_github_call()
+        return method(*args, **kwargs)
+    wrapper._sentinel_counted = True
+    return wrapper
+
+
+def install_github_counter():
+    """Count every REST/GraphQL request PyGithub makes"""
+    for name in (
+        "requestJsonAndCheck",
+        "requestMultipartAndCheck",
+        "requestBlobAndCheck",
+        "requestMemoryBlobAndCheck",
+    ):
+        method = getattr(Requester, name, None)
+        if method is not None and not getattr(method, "_sentinel_counted", False):
+            setattr(Requester, name, _counted(method))
+
+
+install_github_counter()
@@ -1,65 +1,192 @@
-from github import Github
-from app.config import GITHUB_TOKEN
+from app.auth import get_github, token_for
+from app.repo_cache import get_pull, get_repo
+from app.comments import fit_comment, upsert_comment
+from app.graphql import GraphQLError, MutationBatch, queue_labels
 from app.checks import run_checks
+from app.check_runs import CheckRunReporter
+from app import metrics
 from app.gemini import review_with_gemini
+from app.diffs import api_diff
+from app.config import CHECK_CACHE_TTL_SECONDS
+from app.state import get_store
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import logging
+import re
 
 logger = logging.getLogger(__name__)
-gh = Github(GITHUB_TOKEN)
 
-async def handle_pr(payload):
+# PR comment that re-runs every check stage, bypassing cached results
+RECHECK_COMMAND = re.compile(r"^\s*/sentinel\s+recheck\b", re.IGNORECASE)
+
+# Commenters allowed to re-run checks, besides the PR's author
+RECHECK_ASSOCIATIONS = ("OWNER", "MEMBER", "COLLABORATOR")
+
+# PR actions that trigger a review and checks
+PR_ACTIONS = ["opened", "reopened", "synchronize"]
+
+
+def is_recheck(payload):
+    """True for a new `/sentinel recheck` comment on a PR from someone allowed to run it"""
+    comment = payload.get("comment") or {}
+    issue_data = payload.get("issue") or {}
+    if payload.get("action") != "created" or "pull_request" not in issue_data:
+        return False
+    user = comment.get("user") or {}
+    if user.get("type") == "Bot" or not RECHECK_COMMAND.match(comment.get("body") or ""):
+        return False
+    # A recheck clones and installs the PR, so strangers on public repos can't trigger it
+    return (
+        comment.get("author_association") in RECHECK_ASSOCIATIONS
+        or user.get("login") == (issue_data.get("user") or {}).get("login")
+    )
+
+
+def _review_key(repo_name, number):
+    return f"ai_review:{repo_name}#{number}"
+
+
+def _early_review(payload, head_sha, diff_text):
+    """AI review of the checkout diff, posted while install, lint and audit still run"""
+    pr_data = payload["pull_request"]
+    repo_name = payload["repository"]["full_name"]
+    logger.info(f"Generating AI review for PR #{pr_data['number']} in {repo_name}")
+    gemini_summary = review_with_gemini(diff_text)
+    get_store().set(_review_key(repo_name, pr_data["number"]), {"sha": head_sha, "text": gemini_summary},
+                    ttl=CHECK_CACHE_TTL_SECONDS)
+    try:
+        batch = MutationBatch(token_for(payload))
+        upsert_comment(batch, pr_data["node_id"], repo_name, pr_data["number"],
+                       fit_comment(["⏳ **Checks running.**", gemini_summary]))
+        batch.execute()
+        metrics.first_feedback()
+    except Exception as e:
+        logger.error(f"Error posting early AI review: {str(e)}")
+    return gemini_summary
+
+async def handle_pr(payload, force=False):
+    reporter = None
     try:
         pr_data = payload["pull_request"]
         action = payload.get("action", "opened")
         repo_name = payload["repository"]["full_name"]
         
-        # Only process newly opened PRs or synchronize events
-        if action not in ["opened", "synchronize"]:
+        # Only process opened/reopened PRs or synchronize events
+        if action not in PR_ACTIONS:
             logger.info(f"Skipping PR #{pr_data['number']} - action: {action}")
             return
         
         logger.info(f"Processing PR #{pr_data['number']} in {repo_name}")
         
-        repo = gh.get_repo(repo_name)
-        pr = repo.get_pull(pr_data["number"])
+        gh = get_github(payload)
+        pr = get_pull(gh, payload)
+        batch = MutationBatch(token_for(payload))
 
-        # Check if PR should be closed (spam, unnecessary, etc.)
-        if should_close_pr(pr.title, pr.body):
+        # Check if a new PR should be closed (spam, unnecessary, etc.); a reopened
+        # one was reopened on purpose, and pushes and rechecks don't change that
+        if action == "opened" and should_close_pr(pr.title, pr.body):
             logger.info(f"Closing PR #{pr_data['number']} - identified as spam/unnecessary")
-            pr.create_issue_comment("🤖 **Auto-closing:** This PR appears to be spam or unnecessary. If this was closed in error, please reopen with more details.")
-            pr.edit(state="closed")
+            batch.add_comment(pr_data["node_id"], "🤖 **Auto-closing:** This PR appears to be spam or unnecessary. If this was closed in error, please reopen with more details.")
+            batch.close_pull_request(pr_data["node_id"])
+            batch.execute()
             return
 
         branch = pr.head.ref
         clone_url = pr.head.repo.clone_url
-        diff_url = pr.diff_url
+
+        # Show an in-progress Check Run right away, then fill it in stage by stage
+        reporter = CheckRunReporter(gh, payload, pr.head.sha)
+
+        # A review of this commit may already be stored (reopened PRs, restarts)
+        store = get_store()
+        review = store.get(_review_key(repo_name, pr.number))
+        stored_review = review["text"] if review and review["sha"] == pr.head.sha else None
 
         logger.info(f"Running checks for branch {branch}")
-        checks_summary = run_checks(clone_url, branch)
-        
-        logger.info("Generating AI review")
-        gemini_summary = review_with_gemini(diff_url)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            reviews = []
+
+            def on_diff(diff_text):
+                # Review the checkout's diff alongside install/lint instead of downloading it again
+                if stored_review is None:
+                    reviews.append(executor.submit(
+                        contextvars.copy_context().run, _early_review, payload, pr.head.sha, diff_text
+                    ))
 
-        comment = "\n\n".join(checks_summary + [gemini_summary])
+            checks_summary = run_checks(clone_url, branch, pr.head.sha, force=force, on_stage=reporter.stage,
+                                        base_sha=pr.base.sha, base_clone_url=pr.base.repo.clone_url,
+                                        on_diff=on_diff)
+
+            if stored_review is not None:
+                gemini_summary = stored_review
+            elif reviews:
+                gemini_summary = reviews[0].result()
+            else:
+                # Cached check results mean there was no checkout to diff
+                logger.info("Generating AI review")
+                try:
+                    diff_text = api_diff(payload)
+                except Exception as e:
+                    logger.error(f"Failed to fetch PR diff: {str(e)}")
+                    diff_text = ""
+                gemini_summary = review_with_gemini(diff_text)
+                store.set(_review_key(repo_name, pr.number), {"sha": pr.head.sha, "text": gemini_summary},
+                          ttl=CHECK_CACHE_TTL_SECONDS)
+        reporter.stage("AI review", [gemini_summary])
+        reporter.complete()
+
+        comment = fit_comment(checks_summary + [gemini_summary])
 
         logger.info("Posting comment to PR")
-        pr.create_issue_comment(comment)
-        pr.add_to_labels("needs-review")
+        upsert_comment(batch, pr_data["node_id"], repo_name, pr.number, comment)
+        
+        if not any(label.get("name") == "needs-review" for label in pr_data.get("labels", [])):
+            queue_labels(batch, pr, repo_name, ["needs-review"])
+        
+        # Comment and label go out in one GraphQL round trip
+        try:
+            batch.execute()
+        except GraphQLError as e:
+            # Some writes went through; don't replace the results comment with an error
+            logger.error(f"Failed to update PR #{pr_data['number']}: {str(e)}")
+            return
+        metrics.first_feedback()
         
         logger.info(f"Successfully processed PR #{pr_data['number']}")
         
     except Exception as e:
         logger.error(f"Error processing PR: {str(e)}")
+        if reporter:
+            reporter.complete(error=str(e))
         # Try to post error comment to PR
         try:
             pr_data = payload["pull_request"]
-            repo_name = payload["repository"]["full_name"]
-            repo = gh.get_repo(repo_name)
-            pr = repo.get_pull(pr_data["number"])
-            pr.create_issue_comment(f"❌ **Error processing PR:** {str(e)}")
+            batch = MutationBatch(token_for(payload))
+            upsert_comment(batch, pr_data["node_id"], payload["repository"]["full_name"], pr_data["number"], f"❌ **Error processing PR:** {str(e)}")
+            batch.execute()
         except:
             logger.error("Failed to post error comment to PR")
 
+async def handle_pr_command(payload):
+    """Handle `/sentinel recheck` comments on pull requests"""
+    try:
+        comment = payload["comment"]
+        issue_data = payload["issue"]
+        
+        if not is_recheck(payload):
+            return
+        
+        logger.info(f"Recheck requested on PR #{issue_data['number']} by {comment['user']['login']}")
+        
+        # issue_comment payloads only carry the issue side of the PR
+        gh = get_github(payload)
+        pr = get_repo(gh, payload).get_pull(issue_data["number"])
+        
+        await handle_pr(dict(payload, action="synchronize", pull_request=pr.raw_data), force=True)
+        
+    except Exception as e:
+        logger.error(f"Error processing PR command: {str(e)}")
+
 def should_close_pr(title, body):
     """Determine if a PR should be automatically closed"""
     if not title and not body:
@@ -0,0 +1,105 @@
+import collections
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Bytes of each stream kept in memory; the rest only lives in the spill file
+TAIL_BYTES = 16384
+CHUNK_BYTES = 65536
+
+
+class RingBuffer:
+    """Keeps the last `limit` bytes written to it"""
+
+    def __init__(self, limit=TAIL_BYTES):
+        self.limit = limit
+        self.chunks = collections.deque()
+        self.size = 0
+        self.dropped = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.size - len(self.chunks[0]) >= self.limit:
+            dropped = self.chunks.popleft()
+            self.size -= len(dropped)
+            self.dropped += len(dropped)
+
+    def text(self):
+        data = b"".join(self.chunks)[-self.limit:]
+        if not self.dropped and self.size <= self.limit:
+            return data.decode("utf-8", errors="replace")
+        # Start at a line boundary rather than mid-line
+        data = data[data.find(b"\n") + 1:]
+        return "… (earlier output truncated)\n" + data.decode("utf-8", errors="replace")
+
+
+class CapturedProcess:
+    """Result of run(): exit code, in-memory tails and spill files with the full output"""
+
+    def __init__(self, args, returncode, spill_dir, stdout_tail, stderr_tail):
+        self.args = args
+        self.returncode = returncode
+        self.stdout_path = os.path.join(spill_dir, "stdout")
+        self.stderr_path = os.path.join(spill_dir, "stderr")
+        self.stdout_tail = stdout_tail
+        self.stderr_tail = stderr_tail
+
+    def open_stdout(self):
+        return open(self.stdout_path, encoding="utf-8", errors="replace")
+
+
+def _pump(stream, spill_path, tail, on_chunk):
+    with open(spill_path, "wb") as spill:
+        for data in iter(lambda: stream.read1(CHUNK_BYTES), b""):
+            spill.write(data)
+            tail.write(data)
+            if on_chunk:
+                try:
+                    on_chunk(data)
+                except Exception as e:
+                    # Keep draining the pipe so the process can't block on a full buffer
+                    logger.error(f"Output parser failed: {str(e)}")
+                    on_chunk = None
+
+
+def run(args, cwd, timeout, spill_dir, on_stdout=None, check=False):
+    """Run a command, streaming stdout/stderr to spill files in spill_dir.
+
+    Only the last TAIL_BYTES of each stream are kept in memory. on_stdout(bytes)
+    sees stdout chunks as they arrive, for incremental parsing. Raises
+    subprocess.TimeoutExpired / CalledProcessError like subprocess.run.
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    stdout_tail, stderr_tail = RingBuffer(), RingBuffer()
+    proc = subprocess.Popen(args, cwd=cwd, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    pumps = [
+        threading.Thread(target=_pump, args=(proc.stdout, os.path.join(spill_dir, "stdout"), stdout_tail, on_stdout)),
+        threading.Thread(target=_pump, args=(proc.stderr, os.path.join(spill_dir, "stderr"), stderr_tail, None)),
+    ]
+    for pump in pumps:
+        pump.start()
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        for pump in pumps:
+            pump.join()
+
+    result = CapturedProcess(args, proc.returncode, spill_dir, stdout_tail.text(), stderr_tail.text())
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args, result.stdout_tail, result.stderr_tail)
+    return result
+
+
+def spill_dir(prefix="sentinel-proc-"):
+    """Scratch directory for spill files, outside any checkout"""
+    return tempfile.TemporaryDirectory(prefix=prefix)
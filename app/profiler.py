@@ -0,0 +1,136 @@
+from app.config import PROFILE_DIR, PROFILE_KEEP
+from collections import Counter
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.01
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _cpu_ticks(native_id):
+    """User+system CPU ticks of one thread (Linux only)"""
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[11]) + int(fields[12])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def cpu_mode_supported():
+    return _cpu_ticks(threading.get_native_id()) is not None
+
+
+class Sampler:
+    """Samples Python stacks of live threads from a background thread.
+
+    mode="wall" counts one sample per thread per tick, so time spent waiting
+    on the network shows up. mode="cpu" weights each sample by the CPU ticks
+    the thread used since the previous one, so idle threads drop out.
+    thread_ids limits sampling to those threads.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, mode="wall", thread_ids=None):
+        self.interval = interval
+        self.mode = mode
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._cpu = {}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                thread = names.get(ident)
+                weight = 1
+                if self.mode == "cpu":
+                    ticks = _cpu_ticks(thread.native_id) if thread else None
+                    if ticks is None:
+                        continue
+                    weight = ticks - self._cpu.get(ident, ticks)
+                    self._cpu[ident] = ticks
+                    if weight <= 0:
+                        continue
+                thread_name = thread.name if thread else str(ident)
+                self.stacks[f"{thread_name};{_stack(frame)}"] += weight
+            self.samples += 1
+
+
+def sample(seconds, interval=DEFAULT_INTERVAL, mode="wall"):
+    """Profile every thread of this process for `seconds`"""
+    sampler = Sampler(interval, mode).start()
+    time.sleep(seconds)
+    return sampler.stop()
+
+
+def collapse(stacks):
+    """Collapsed-stack text (`frame;frame;frame count` per line) for flamegraph.pl / speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class JobProfile:
+    """Samples the current thread while a job runs and writes its stacks to PROFILE_DIR"""
+
+    def __init__(self, name):
+        self.name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+        self.sampler = None
+
+    def __enter__(self):
+        self.started = time.time()
+        self.sampler = Sampler(thread_ids=[threading.get_ident()]).start()
+        return self
+
+    def __exit__(self, *exc):
+        stacks = self.sampler.stop()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{int(self.started * 1000)}-{self.name}.collapsed")
+            with open(path, "w") as f:
+                f.write(collapse(stacks))
+            logger.info(f"Wrote job profile {path} ({time.time() - self.started:.2f}s)")
+            _rotate()
+        except OSError as e:
+            logger.error(f"Failed to write job profile: {str(e)}")
+        return False
+
+
+def _rotate():
+    profiles = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".collapsed")),
+        key=lambda entry: entry.name,
+    )
+    for entry in profiles[:-max(PROFILE_KEEP, 1)]:
+        os.unlink(entry.path)
@@ -0,0 +1,106 @@
+from github.Repository import Repository
+from github.PullRequest import PullRequest
+from github.Issue import Issue
+from app.config import REPO_CACHE_SIZE, REPO_CACHE_TTL_SECONDS
+from app.state import get_store
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def drop(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+
+# (repo full name, kind) -> (generation, value)
+_metadata = TTLCache(REPO_CACHE_SIZE, REPO_CACHE_TTL_SECONDS)
+
+
+def _generation(repo_name):
+    # Bumped on repository events so every worker drops its stale entries
+    return get_store().get(f"repo_gen:{repo_name}", 0)
+
+
+def cached_metadata(repo_name, kind, loader):
+    """Return cached metadata for a repository, calling loader() on a miss"""
+    generation = _generation(repo_name)
+    entry = _metadata.get((repo_name, kind))
+    if entry is not None and entry[0] == generation:
+        return entry[1]
+
+    value = loader()
+    _metadata.set((repo_name, kind), (generation, value))
+    return value
+
+
+def forget(repo_name, kind):
+    _metadata.pop((repo_name, kind))
+
+
+def invalidate(repo_name):
+    """Forget cached metadata for a repository in every worker process"""
+    logger.info(f"Invalidating cached metadata for {repo_name}")
+    get_store().incr(f"repo_gen:{repo_name}")
+    _metadata.drop(lambda key: key[0] == repo_name)
+
+
+def get_repo(gh, payload):
+    """Repository object for a webhook, without a REST round trip when possible"""
+    data = payload["repository"]
+    repo_name = data["full_name"]
+
+    # Webhook payloads carry the full repository object; keep it as the cached copy
+    if "url" in data and "owner" in data:
+        _metadata.set((repo_name, "repo"), (_generation(repo_name), data))
+        raw = data
+    else:
+        raw = cached_metadata(repo_name, "repo", lambda: gh.get_repo(repo_name).raw_data)
+
+    return gh.create_from_raw_data(Repository, raw)
+
+
+def get_pull(gh, payload):
+    """Pull request object hydrated from the webhook payload"""
+    return gh.create_from_raw_data(PullRequest, payload["pull_request"])
+
+
+def get_issue(gh, payload):
+    """Issue object hydrated from the webhook payload"""
+    return gh.create_from_raw_data(Issue, payload["issue"])
@@ -0,0 +1,121 @@
+from collections import OrderedDict, deque
+import logging
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first. A job's priority is its index here.
+PRIORITY_CLASSES = ["alerts", "replies", "checks"]
+
+
+def priority_of(job_class):
+    return PRIORITY_CLASSES.index(job_class)
+
+
+def repo_of(key):
+    return key.rsplit("#", 1)[0]
+
+
+class Lane:
+    """A single worker thread that runs jobs one at a time.
+
+    Pending jobs are grouped per repository and the lane takes one job from
+    each repository in turn, so a burst from one repo cannot starve the other
+    repositories hashed onto the same lane. Jobs for one key stay in order.
+    """
+
+    def __init__(self, index, capacity, run):
+        self.index = index
+        self.capacity = capacity
+        self.run = run
+        self.pending = OrderedDict()
+        self.size = 0
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.thread = threading.Thread(target=self._loop, name=f"lane-{index}", daemon=True)
+
+    def put(self, job, timeout=None, overflow=False):
+        with self.cond:
+            # Backpressure: callers wait while the lane is full, unless they overflow it
+            if not overflow and not self.cond.wait_for(lambda: self.size < self.capacity or self.stopping, timeout):
+                return False
+            if self.stopping:
+                return False
+            self.pending.setdefault(repo_of(job["key"]), deque()).append(job)
+            self.size += 1
+            self.cond.notify_all()
+            return True
+
+    def _next(self):
+        repo, jobs = next(iter(self.pending.items()))
+        job = jobs.popleft()
+        del self.pending[repo]
+        if jobs:
+            # Rotate the repository to the back of the line
+            self.pending[repo] = jobs
+        self.size -= 1
+        self.cond.notify_all()
+        return job
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.size > 0 or self.stopping)
+                if self.stopping:
+                    return
+                job = self._next()
+            try:
+                self.run(job)
+            except Exception as e:
+                logger.error(f"Lane {self.index} job error: {str(e)}")
+
+    def drain(self):
+        """Stop accepting work and return jobs that never started"""
+        with self.cond:
+            self.stopping = True
+            leftover = [job for jobs in self.pending.values() for job in jobs]
+            self.pending.clear()
+            self.size = 0
+            self.cond.notify_all()
+        return leftover
+
+
+class LaneScheduler:
+    """Hashes jobs onto lanes by key: strict order per PR/issue, parallel across them"""
+
+    def __init__(self, lanes, lane_capacity, run):
+        self.lanes = [Lane(i, lane_capacity, run) for i in range(lanes)]
+
+    def start(self):
+        for lane in self.lanes:
+            lane.thread.start()
+
+    def lane_for(self, key):
+        # crc32 is stable across processes, unlike hash()
+        return self.lanes[zlib.crc32(key.encode()) % len(self.lanes)]
+
+    def submit(self, job, timeout=None):
+        return self.lane_for(job["key"]).put(job, timeout)
+
+    def offer(self, job):
+        """Queue a claimed job without waiting, past its lane's capacity if need be.
+
+        has_capacity() bounds the total, so a full lane holds its extra jobs
+        here while claiming carries on for the other lanes.
+        """
+        return self.lane_for(job["key"]).put(job, overflow=True)
+
+    def has_capacity(self):
+        return (
+            any(lane.size < lane.capacity for lane in self.lanes)
+            and sum(lane.size for lane in self.lanes) < sum(lane.capacity for lane in self.lanes)
+        )
+
+    def stop(self, timeout=10):
+        leftover = []
+        for lane in self.lanes:
+            leftover.extend(lane.drain())
+        for lane in self.lanes:
+            lane.thread.join(timeout)
+        return leftover
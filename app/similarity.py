@@ -0,0 +1,170 @@
+"""Near-duplicate index for issues and discussions.
+
+Each thread's normalised text is reduced to a MinHash signature over word
+shingles and filed under LSH band buckets in a local SQLite file, per
+repository. A lookup is one indexed query for the new text's band hashes,
+then a signature comparison against the few candidates it returns.
+"""
+
+from app.config import SIMILARITY_DB_PATH, DUPLICATE_THRESHOLD
+import hashlib
+import logging
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+MIN_SHINGLES = 5
+MAX_TEXT_CHARS = 20000
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: signatures must match across processes and restarts
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    url TEXT,
+    signature BLOB NOT NULL,
+    reply TEXT NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+CREATE TABLE IF NOT EXISTS bands (
+    repo TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    number INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_bucket ON bands (repo, bucket);
+"""
+
+
+def normalise(text):
+    """Lowercase word tokens with numbers and addresses masked, so stack traces from different runs match"""
+    text = text[:MAX_TEXT_CHARS].lower()
+    text = re.sub(r"0x[0-9a-f]+", "0x", text)
+    text = re.sub(r"\d+", "0", text)
+    return re.findall(r"[a-z0-9_]+", text)
+
+
+def _shingles(words):
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text):
+    """MinHash signature of the text's word shingles, or None if the text is too short to compare"""
+    shingles = _shingles(normalise(text))
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _buckets(sig):
+    return [
+        f"{band}:" + hashlib.blake2b(struct.pack(f"{ROWS}Q", *sig[band * ROWS:(band + 1) * ROWS]), digest_size=8).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+class SimilarityIndex:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._ready = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if not self._ready:
+                conn.executescript(_SCHEMA)
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def find(self, repo, text, exclude=None, threshold=DUPLICATE_THRESHOLD):
+        """Most similar earlier thread at or above threshold, as a dict, or None"""
+        sig = signature(text)
+        if sig is None:
+            return None
+        buckets = _buckets(sig)
+        try:
+            rows = self._conn().execute(
+                f"""
+                SELECT t.number, t.kind, t.url, t.signature, t.reply FROM threads t
+                WHERE t.repo = ? AND t.number IN (
+                    SELECT number FROM bands WHERE repo = ? AND bucket IN ({",".join("?" * len(buckets))})
+                )
+                """,
+                [repo, repo, *buckets],
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Similarity lookup failed: {str(e)}")
+            return None
+
+        best = None
+        for number, kind, url, blob, reply in rows:
+            if number == exclude:
+                continue
+            score = similarity(sig, struct.unpack(f"{NUM_PERM}Q", blob))
+            if score >= threshold and (best is None or score > best["similarity"]):
+                best = {"number": number, "kind": kind, "url": url, "reply": reply, "similarity": score}
+        return best
+
+    def add(self, repo, number, kind, url, text, reply):
+        """Index a thread and the reply it got, for later lookups"""
+        sig = signature(text)
+        if sig is None:
+            return
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to index thread {repo}#{number}: {str(e)}")
+            return
+        try:
+            conn.execute("DELETE FROM bands WHERE repo = ? AND number = ?", (repo, number))
+            conn.execute(
+                "INSERT OR REPLACE INTO threads (repo, number, kind, url, signature, reply) VALUES (?, ?, ?, ?, ?, ?)",
+                (repo, number, kind, url, struct.pack(f"{NUM_PERM}Q", *sig), reply),
+            )
+            conn.executemany(
+                "INSERT INTO bands (repo, bucket, number) VALUES (?, ?, ?)",
+                [(repo, bucket, number) for bucket in _buckets(sig)],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            logger.error(f"Failed to index thread {repo}#{number}: {str(e)}")
+
+
+index = SimilarityIndex(SIMILARITY_DB_PATH)
+
+
+def duplicate_reply(match):
+    """Reply for a near-duplicate: link the earlier thread and reuse the answer it got"""
+    label = "discussion" if match["kind"] == "discussion" else "issue"
+    link = match["url"] or f"#{match['number']}"
+    return (
+        f"🔁 **This looks like a duplicate of {label} #{match['number']}** "
+        f"({match['similarity']:.0%} similar): {link}\n\n"
+        f"Here is the answer given there:\n\n{match['reply']}"
+    )
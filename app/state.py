@@ -0,0 +1,470 @@
+from app.config import STATE_BACKEND, STATE_DB_PATH, REDIS_URL, JOB_LEASE_SECONDS
+from contextlib import contextmanager
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    event TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    delivery TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_key_state ON jobs (key, state, id);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+
+class SQLiteStore:
+    """Shared state for every worker process on one host, backed by a SQLite file in WAL mode"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        # Databases created before priority classes lack the column
+        if "priority" not in [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]:
+            conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_state_priority ON jobs (state, priority, id)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Key/value with optional expiry
+
+    def get(self, key, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at),
+        )
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def add_if_absent(self, key, value=1, ttl=None):
+        """Set key only if it is missing or expired; returns True when this call set it"""
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            return cursor.rowcount == 1
+
+    def incr(self, key, amount=1):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + amount
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, NULL)",
+                (key, json.dumps(value)),
+            )
+            return value
+
+    def delete_if_equal(self, key, value):
+        cursor = self._conn().execute(
+            "DELETE FROM kv WHERE key = ? AND value = ?", (key, json.dumps(value))
+        )
+        return cursor.rowcount == 1
+
+    def items(self, prefix):
+        rows = self._conn().execute(
+            "SELECT key, value FROM kv WHERE substr(key, 1, ?) = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (len(prefix), prefix, time.time()),
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def purge_expired(self):
+        self._conn().execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+
+    # Job queue: one job per key runs at a time, oldest first within a priority class
+
+    def enqueue(self, key, event, payload, delivery=None, priority=0):
+        cursor = self._conn().execute(
+            "INSERT INTO jobs (key, event, payload, delivery, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, event, json.dumps(payload), delivery, priority, time.time()),
+        )
+        return cursor.lastrowid
+
+    def claim(self, owner, repo_limit=None, priority=None, aging=None):
+        """Claim the oldest runnable job of a priority class.
+
+        With priority=None any class is taken, lowest class first. Jobs of a
+        less urgent class are also taken once they have waited `aging`
+        seconds per class of difference, so they cannot starve. repo_limit
+        caps running jobs per repository within a class.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT id, key, event, payload, delivery, created_at, priority FROM jobs j
+                WHERE state = 'pending'
+                  AND (:priority IS NULL OR j.priority = :priority OR (
+                      :aging IS NOT NULL AND j.priority > :priority
+                      AND j.created_at <= :now - (j.priority - :priority) * :aging
+                  ))
+                  AND NOT EXISTS (SELECT 1 FROM jobs r WHERE r.key = j.key AND r.state = 'running')
+                  AND NOT EXISTS (SELECT 1 FROM jobs e WHERE e.key = j.key AND e.state = 'pending' AND e.id < j.id)
+                  AND (:limit IS NULL OR (
+                      SELECT COUNT(*) FROM jobs b WHERE b.state = 'running' AND b.priority = j.priority
+                        AND substr(b.key, 1, instr(b.key, '#')) = substr(j.key, 1, instr(j.key, '#'))
+                  ) < :limit)
+                ORDER BY j.priority != :priority, j.priority, id LIMIT 1
+                """,
+                {"priority": priority, "aging": aging, "now": now, "limit": repo_limit},
+            ).fetchone()
+            if not row:
+                return None
+            # The lease token makes the owner unique per claim, so a worker whose
+            # lease expired cannot renew or complete the job's next claim
+            owner = f"{owner}/{uuid.uuid4().hex}"
+            conn.execute(
+                "UPDATE jobs SET state = 'running', owner = ?, claimed_at = ? WHERE id = ?",
+                (owner, time.time(), row[0]),
+            )
+        return {
+            "id": row[0],
+            "key": row[1],
+            "event": row[2],
+            "payload": json.loads(row[3]),
+            "delivery": row[4],
+            "created_at": row[5],
+            "priority": row[6],
+            "lease": owner,
+        }
+
+    def renew(self, job):
+        """Extend a claimed job's lease; False if it was requeued in the meantime"""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET claimed_at = ? WHERE id = ? AND state = 'running' AND owner = ?",
+            (time.time(), job["id"], job["lease"]),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job):
+        # Only the current claim may finish the job; a requeued copy belongs to someone else
+        self._conn().execute("DELETE FROM jobs WHERE id = ? AND owner = ?", (job["id"], job["lease"]))
+
+    def release(self, job):
+        """Return a claimed job that never started to the queue"""
+        self._conn().execute(
+            "UPDATE jobs SET state = 'pending', owner = NULL, claimed_at = NULL WHERE id = ? AND owner = ?",
+            (job["id"], job["lease"]),
+        )
+
+    def requeue_stale(self, lease=JOB_LEASE_SECONDS):
+        """Hand jobs held by a crashed worker back to the queue"""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET state = 'pending', owner = NULL, claimed_at = NULL "
+            "WHERE state = 'running' AND claimed_at < ?",
+            (time.time() - lease,),
+        )
+        return cursor.rowcount
+
+    @contextmanager
+    def lock(self, name, ttl=300, wait=60):
+        with _kv_lock(self, name, ttl, wait):
+            yield
+
+
+# Redis job scripts keep "one running job per key" atomic across hosts.
+# Keys: q:<key> holds pending jobs, q:ready:<priority> is a zset of keys whose
+# head job is claimable, scored by that job's creation time, running:<key>
+# marks a key as busy, running is a hash of leases and
+# inflight:<priority>:<repo> counts running jobs per class and repository.
+
+_ENQUEUE_LUA = """
+if redis.call('RPUSH', KEYS[1], ARGV[1]) == 1 and redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('ZADD', ARGV[2] .. 'q:ready:' .. ARGV[3], 'NX', ARGV[4], ARGV[5])
+end
+return 1
+"""
+
+_CLAIM_LUA = """
+local limit = tonumber(ARGV[3])
+for i = 5, #ARGV, 2 do
+    local ready = ARGV[1] .. 'q:ready:' .. ARGV[i]
+    for _, key in ipairs(redis.call('ZRANGEBYSCORE', ready, '-inf', ARGV[i + 1], 'LIMIT', 0, 64)) do
+        local repo = string.match(key, '^(.*)#') or key
+        local inflight_key = ARGV[1] .. 'inflight:' .. ARGV[i] .. ':' .. repo
+        local inflight = tonumber(redis.call('GET', inflight_key) or '0')
+        if limit < 0 or inflight < limit then
+            redis.call('ZREM', ready, key)
+            local job = redis.call('LPOP', ARGV[1] .. 'q:' .. key)
+            if job then
+                redis.call('SET', ARGV[1] .. 'running:' .. key, '1')
+                redis.call('INCR', inflight_key)
+                redis.call('HSET', KEYS[1], key, cjson.encode({job = job, claimed_at = tonumber(ARGV[2]), lease = ARGV[4]}))
+                return job
+            end
+        end
+    end
+end
+return false
+"""
+
+_COMPLETE_LUA = """
+local raw = redis.call('HGET', KEYS[3], ARGV[1])
+if not raw or cjson.decode(raw).lease ~= ARGV[5] then
+    return 0
+end
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('DECR', ARGV[2] .. 'inflight:' .. ARGV[4] .. ':' .. ARGV[3])
+redis.call('DEL', KEYS[2])
+local head = redis.call('LINDEX', KEYS[1], 0)
+if head then
+    local job = cjson.decode(head)
+    redis.call('ZADD', ARGV[2] .. 'q:ready:' .. (job.priority or 0), 'NX', job.created_at, ARGV[1])
+end
+return 1
+"""
+
+_REQUEUE_LUA = """
+local raw = redis.call('HGET', KEYS[3], ARGV[1])
+if not raw then
+    return 0
+end
+local lease = cjson.decode(raw)
+if lease.claimed_at >= tonumber(ARGV[2]) or (ARGV[5] ~= '' and lease.lease ~= ARGV[5]) then
+    return 0
+end
+local job = cjson.decode(lease.job)
+local priority = job.priority or 0
+redis.call('LPUSH', KEYS[1], lease.job)
+redis.call('DEL', KEYS[2])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('DECR', ARGV[3] .. 'inflight:' .. priority .. ':' .. ARGV[4])
+redis.call('ZADD', ARGV[3] .. 'q:ready:' .. priority, 'NX', job.created_at, ARGV[1])
+return 1
+"""
+
+_RENEW_LUA = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then
+    return 0
+end
+local lease = cjson.decode(raw)
+if lease.lease ~= ARGV[2] then
+    return 0
+end
+lease.claimed_at = tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(lease))
+return 1
+"""
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisStore:
+    """Shared state for workers on several hosts, backed by any Redis-compatible server"""
+
+    prefix = "sentinel:"
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ValueError("STATE_BACKEND=redis requires the 'redis' package")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.redis = client
+        self._enqueue = client.register_script(_ENQUEUE_LUA)
+        self._claim = client.register_script(_CLAIM_LUA)
+        self._complete = client.register_script(_COMPLETE_LUA)
+        self._requeue = client.register_script(_REQUEUE_LUA)
+        self._renew = client.register_script(_RENEW_LUA)
+        self._release = client.register_script(_RELEASE_LUA)
+
+    def _k(self, key):
+        return self.prefix + key
+
+    def get(self, key, default=None):
+        raw = self.redis.get(self._k(key))
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key, value, ttl=None):
+        self.redis.set(self._k(key), json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.redis.delete(self._k(key))
+
+    def add_if_absent(self, key, value=1, ttl=None):
+        return bool(self.redis.set(self._k(key), json.dumps(value), nx=True, ex=int(ttl) if ttl else None))
+
+    def incr(self, key, amount=1):
+        if isinstance(amount, float):
+            return float(self.redis.incrbyfloat(self._k(key), amount))
+        return self.redis.incrby(self._k(key), amount)
+
+    def delete_if_equal(self, key, value):
+        return bool(self._release(keys=[self._k(key)], args=[json.dumps(value)]))
+
+    def items(self, prefix):
+        result = {}
+        for full_key in self.redis.scan_iter(match=self._k(prefix) + "*"):
+            raw = self.redis.get(full_key)
+            if raw is not None:
+                result[full_key[len(self.prefix):]] = json.loads(raw)
+        return result
+
+    def purge_expired(self):
+        # Redis expires keys on its own
+        pass
+
+    def _job_keys(self, key):
+        return [self._k("q:" + key), self._k("running:" + key), self._k("running")]
+
+    def enqueue(self, key, event, payload, delivery=None, priority=0):
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "key": key,
+            "event": event,
+            "payload": payload,
+            "delivery": delivery,
+            "priority": priority,
+            "created_at": time.time(),
+        }
+        self._enqueue(
+            keys=self._job_keys(key)[:2],
+            args=[json.dumps(job), self.prefix, priority, job["created_at"], key],
+        )
+        return job_id
+
+    def claim(self, owner, repo_limit=None, priority=None, aging=None, classes=8):
+        # (class, max head creation time) pairs in the order they are searched
+        if priority is None:
+            searches = [(p, "+inf") for p in range(classes)]
+        else:
+            searches = [(priority, "+inf")]
+            if aging is not None:
+                now = time.time()
+                searches += [(p, now - (p - priority) * aging) for p in range(priority + 1, classes)]
+        lease = f"{owner}/{uuid.uuid4().hex}"
+        raw = self._claim(
+            keys=[self._k("running")],
+            args=[self.prefix, time.time(), -1 if repo_limit is None else repo_limit, lease]
+            + [value for search in searches for value in search],
+        )
+        if not raw:
+            return None
+        job = json.loads(raw)
+        job["lease"] = lease
+        return job
+
+    def renew(self, job):
+        return bool(self._renew(keys=[self._k("running")], args=[job["key"], job["lease"], time.time()]))
+
+    def complete(self, job):
+        self._complete(
+            keys=self._job_keys(job["key"]),
+            args=[job["key"], self.prefix, job["key"].rsplit("#", 1)[0], job.get("priority", 0), job["lease"]],
+        )
+
+    def release(self, job):
+        self._requeue(
+            keys=self._job_keys(job["key"]),
+            args=[job["key"], time.time() + 1, self.prefix, job["key"].rsplit("#", 1)[0], job["lease"]],
+        )
+
+    def requeue_stale(self, lease=JOB_LEASE_SECONDS):
+        count = 0
+        cutoff = time.time() - lease
+        for key in self.redis.hkeys(self._k("running")):
+            count += self._requeue(
+                keys=self._job_keys(key), args=[key, cutoff, self.prefix, key.rsplit("#", 1)[0], ""]
+            )
+        return count
+
+    @contextmanager
+    def lock(self, name, ttl=300, wait=60):
+        with _kv_lock(self, name, ttl, wait):
+            yield
+
+
+@contextmanager
+def _kv_lock(store, name, ttl, wait):
+    key = f"lock:{name}"
+    token = uuid.uuid4().hex
+    deadline = time.time() + wait
+    while not store.add_if_absent(key, token, ttl=ttl):
+        if time.time() >= deadline:
+            raise TimeoutError(f"Timed out waiting for lock {name}")
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        store.delete_if_equal(key, token)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide state store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if STATE_BACKEND == "redis":
+                    logger.info("Using Redis state backend")
+                    _store = RedisStore(REDIS_URL)
+                else:
+                    logger.info(f"Using SQLite state backend at {STATE_DB_PATH}")
+                    _store = SQLiteStore(STATE_DB_PATH)
+    return _store
@@ -0,0 +1,170 @@
+from app.config import (
+    JOB_POLL_SECONDS,
+    JOB_LEASE_SECONDS,
+    JOB_LANES,
+    ALERT_LANES,
+    REPLY_LANES,
+    LANE_CAPACITY,
+    REPO_MAX_INFLIGHT,
+    PROFILE_EVERY_N,
+)
+from app.github import handle_event
+from app.metrics import event_scope, observe
+from app.profiler import JobProfile
+from app.scheduler import LaneScheduler, PRIORITY_CLASSES
+from app.state import get_store
+from contextlib import nullcontext
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lanes per priority class: every class has its own concurrency budget
+POOL_LANES = {
+    "alerts": ALERT_LANES,
+    "replies": REPLY_LANES,
+    "checks": JOB_LANES,
+}
+
+_stop = threading.Event()
+_threads = []
+_schedulers = {}
+# Jobs this process holds a lease on, by id, renewed by the heartbeat thread
+_held = {}
+_held_lock = threading.Lock()
+
+
+def _profile(job):
+    """Sample every PROFILE_EVERY_N-th job across all workers end to end"""
+    if PROFILE_EVERY_N <= 0 or get_store().incr("profile:jobs") % PROFILE_EVERY_N:
+        return nullcontext()
+    return JobProfile(f"{job['event']}-{job['key']}")
+
+
+def run_job(job):
+    """Run one queued webhook job to completion and release its key"""
+    store = get_store()
+    job_class = PRIORITY_CLASSES[job.get("priority", 0)]
+    # The lease runs from when the lane starts the job, not from when it was claimed
+    try:
+        renewed = store.renew(job)
+    except Exception as e:
+        logger.error(f"Error renewing job {job['id']}: {str(e)}")
+        renewed = True
+    if not renewed:
+        logger.warning(f"Skipping job {job['id']} for {job['key']}: its lease was requeued")
+        _drop(job)
+        return
+    observe(f"queue_wait_seconds.{job_class}", time.time() - job["created_at"])
+    try:
+        logger.info(f"Running {job_class} job {job['id']} ({job['event']}) for {job['key']}")
+        with _profile(job), event_scope(job["event"], job["created_at"]):
+            asyncio.run(handle_event(job["event"], job["payload"]))
+    except Exception as e:
+        logger.error(f"Job {job['id']} failed: {str(e)}")
+    finally:
+        _drop(job)
+        store.complete(job)
+
+
+def _hold(job):
+    with _held_lock:
+        _held[job["id"]] = job
+
+
+def _drop(job):
+    with _held_lock:
+        _held.pop(job["id"], None)
+
+
+def _heartbeat():
+    """Renew the lease of every held job, so long runs are not requeued as stale"""
+    store = get_store()
+    while not _stop.wait(JOB_LEASE_SECONDS / 3):
+        with _held_lock:
+            jobs = list(_held.values())
+        for job in jobs:
+            try:
+                if not store.renew(job):
+                    logger.warning(f"Lost the lease on job {job['id']} for {job['key']}")
+            except Exception as e:
+                logger.error(f"Error renewing job {job['id']}: {str(e)}")
+
+
+def _consume(worker_id, scheduler, priority):
+    store = get_store()
+    last_sweep = 0
+
+    while not _stop.is_set():
+        try:
+            # Recover jobs left behind by crashed workers every so often
+            if time.time() - last_sweep > JOB_LEASE_SECONDS / 10:
+                last_sweep = time.time()
+                requeued = store.requeue_stale()
+                if requeued:
+                    logger.warning(f"Requeued {requeued} stale job(s)")
+                store.purge_expired()
+
+            # Leave work in the shared queue for other workers while our lanes are full.
+            # Each pool only takes its own class, so cheap events never wait behind PR checks.
+            job = store.claim(
+                worker_id, REPO_MAX_INFLIGHT, priority=priority
+            ) if scheduler.has_capacity() else None
+        except Exception as e:
+            logger.error(f"Error claiming job: {str(e)}")
+            job = None
+
+        if job is None:
+            _stop.wait(JOB_POLL_SECONDS)
+            continue
+
+        # Queued jobs are held too, so their leases survive a wait behind a busy lane.
+        # A job whose lane is full overflows it rather than going back to the queue,
+        # where the next claim would return the same job and starve the other lanes.
+        _hold(job)
+        if not scheduler.offer(job):
+            _drop(job)
+            store.release(job)
+
+
+def start_workers():
+    """Start this process's pool of lanes, and the consumer that feeds it, for each priority class"""
+    if _threads:
+        return
+
+    _stop.clear()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    for priority, job_class in enumerate(PRIORITY_CLASSES):
+        scheduler = LaneScheduler(max(POOL_LANES[job_class], 1), LANE_CAPACITY, run_job)
+        scheduler.start()
+        _schedulers[job_class] = scheduler
+
+        thread = threading.Thread(
+            target=_consume, args=(worker_id, scheduler, priority), name=f"job-consumer-{job_class}", daemon=True
+        )
+        thread.start()
+        _threads.append(thread)
+
+    thread = threading.Thread(target=_heartbeat, name="job-heartbeat", daemon=True)
+    thread.start()
+    _threads.append(thread)
+    logger.info(f"Job consumers started ({worker_id}, lanes per class: {POOL_LANES})")
+
+
+def stop_workers(timeout=10):
+    _stop.set()
+    for thread in _threads:
+        thread.join(timeout)
+    _threads.clear()
+
+    # Jobs that were claimed but never started go back to the shared queue
+    store = get_store()
+    for scheduler in _schedulers.values():
+        for job in scheduler.stop(timeout):
+            _drop(job)
+            store.release(job)
+    _schedulers.clear()
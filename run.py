@@ -25,11 +25,18 @@ def main():
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
     reload = os.getenv("RELOAD", "false").lower() == "true"
+    workers = int(os.getenv("WORKERS", "1"))
+    
+    # Reload only works with a single process
+    if reload and workers > 1:
+        print("⚠️  Warning: RELOAD=true forces a single worker")
+        workers = 1
     
     print("🚀 Starting PR Sentinel...")
     print(f"📍 Host: {host}")
     print(f"🔌 Port: {port}")
     print(f"🔄 Reload: {reload}")
+    print(f"👷 Workers: {workers}")
     
     # Start the server
     uvicorn.run(
@@ -37,6 +44,7 @@ def main():
         host=host,
         port=port,
         reload=reload,
+        workers=workers,
         log_level="info"
     )
 
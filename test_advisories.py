@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline npm advisory index: version encoding, OSV ranges and lockfile resolution
+"""
+
+import json
+import os
+
+import pytest
+
+# app.config refuses to load without credentials; the index never uses them
+os.environ.setdefault("GITHUB_TOKEN", "test_token")
+os.environ.setdefault("GEMINI_API_KEY", "test_key")
+os.environ.setdefault("WEBHOOK_SECRET", "test_secret")
+
+from app.advisories import AdvisoryIndex, _intervals, encode_version, import_advisories, locked_packages
+
+
+# Each version sorts strictly before the next one
+ORDERED_VERSIONS = [
+    "0.9.9",
+    "1.0.0-0",
+    "1.0.0-2",
+    "1.0.0-10",
+    "1.0.0-alpha",
+    "1.0.0-alpha.1",
+    "1.0.0-alpha.beta",
+    "1.0.0-beta",
+    "1.0.0-beta.2",
+    "1.0.0-beta.11",
+    "1.0.0-rc.1",
+    "1.0.0",
+    "1.0.1",
+    "1.2.0",
+    "1.10.0",
+    "10.0.0",
+]
+
+
+@pytest.mark.parametrize("lower, higher", list(zip(ORDERED_VERSIONS, ORDERED_VERSIONS[1:])))
+def test_encode_version_orders_like_semver(lower, higher):
+    assert encode_version(lower) < encode_version(higher)
+
+
+@pytest.mark.parametrize("version, same", [
+    ("v1.2.3", "1.2.3"),
+    ("1.2", "1.2.0"),
+    ("1", "1.0.0"),
+    ("1.2.3+build.5", "1.2.3"),
+    (" 1.2.3 ", "1.2.3"),
+])
+def test_encode_version_normalizes(version, same):
+    assert encode_version(version) == encode_version(same)
+
+
+@pytest.mark.parametrize("version", ["", "latest", "1.x", "^1.2.3", "git+https://example.com/x.git"])
+def test_encode_version_rejects_non_semver(version):
+    assert encode_version(version) is None
+
+
+@pytest.mark.parametrize("events, expected", [
+    # Fixed bounds are exclusive, last_affected bounds inclusive
+    ([{"introduced": "1.0.0"}, {"fixed": "1.2.0"}],
+     [(encode_version("1.0.0"), encode_version("1.2.0"), 0)]),
+    ([{"introduced": "1.0.0"}, {"last_affected": "1.1.9"}],
+     [(encode_version("1.0.0"), encode_version("1.1.9"), 1)]),
+    # "0" means every version up to the bound
+    ([{"introduced": "0"}, {"fixed": "2.0.0"}],
+     [(None, encode_version("2.0.0"), 0)]),
+    # No upper bound: everything from introduced on
+    ([{"introduced": "3.0.0"}],
+     [(encode_version("3.0.0"), None, 0)]),
+    # Several ranges in one event list
+    ([{"introduced": "1.0.0"}, {"fixed": "1.0.5"}, {"introduced": "2.0.0"}, {"fixed": "2.0.1"}],
+     [(encode_version("1.0.0"), encode_version("1.0.5"), 0),
+      (encode_version("2.0.0"), encode_version("2.0.1"), 0)]),
+    # Unparseable bounds drop their range instead of opening it up
+    ([{"introduced": "1.0.0"}, {"fixed": "next"}], []),
+    ([{"introduced": "garbage"}, {"fixed": "2.0.0"}], []),
+    ([{"introduced": "garbage"}], []),
+    ([{"introduced": "garbage"}, {"fixed": "2.0.0"}, {"introduced": "3.0.0"}, {"fixed": "3.1.0"}],
+     [(encode_version("3.0.0"), encode_version("3.1.0"), 0)]),
+    # A bound with no range open is ignored
+    ([{"fixed": "1.0.0"}], []),
+])
+def test_intervals(events, expected):
+    assert _intervals(events) == expected
+
+
+@pytest.fixture
+def advisory_index(tmp_path):
+    source = tmp_path / "osv"
+    source.mkdir()
+    records = [
+        {"id": "GHSA-fixed", "summary": "fixed bound", "database_specific": {"severity": "HIGH"},
+         "affected": [{"package": {"ecosystem": "npm", "name": "left-pad"}, "ranges": [
+             {"type": "SEMVER", "events": [{"introduced": "1.0.0"}, {"fixed": "1.3.0"}]}]}]},
+        {"id": "GHSA-last", "summary": "last affected bound",
+         "affected": [{"package": {"ecosystem": "npm", "name": "right-pad"}, "ranges": [
+             {"type": "SEMVER", "events": [{"introduced": "0"}, {"last_affected": "2.0.0-rc.1"}]}]}]},
+        {"id": "GHSA-bad", "summary": "unparseable bound",
+         "affected": [{"package": {"ecosystem": "npm", "name": "up-pad"}, "ranges": [
+             {"type": "SEMVER", "events": [{"introduced": "1.0.0"}, {"fixed": "unknown"}]}]}]},
+    ]
+    for record in records:
+        (source / f"{record['id']}.json").write_text(json.dumps(record))
+    path = str(tmp_path / "advisories.db")
+    import_advisories(str(source), path)
+    return AdvisoryIndex(path)
+
+
+@pytest.mark.parametrize("package, version, affected", [
+    ("left-pad", "0.9.0", False),
+    ("left-pad", "1.0.0", True),
+    ("left-pad", "1.3.0-beta", True),
+    ("left-pad", "1.3.0", False),
+    ("right-pad", "0.0.1", True),
+    ("right-pad", "2.0.0-rc.1", True),
+    ("right-pad", "2.0.0", False),
+    ("up-pad", "5.0.0", False),
+])
+def test_lookup(advisory_index, package, version, affected):
+    assert bool(advisory_index.lookup(package, version)) == affected
+
+
+def write_lock(tmp_path, lock, name="package-lock.json"):
+    (tmp_path / name).write_text(json.dumps(lock))
+    return str(tmp_path)
+
+
+def test_locked_packages_v1_nested(tmp_path):
+    workdir = write_lock(tmp_path, {
+        "lockfileVersion": 1,
+        "dependencies": {
+            "a": {"version": "1.0.0", "dependencies": {
+                "b": {"version": "2.0.0", "dependencies": {"c": {"version": "3.0.0"}}},
+            }},
+            "b": {"version": "2.1.0"},
+            "local": {"version": "file:../local"},
+        },
+    })
+    assert locked_packages(workdir) == [
+        ("a", "1.0.0"), ("b", "2.0.0"), ("b", "2.1.0"), ("c", "3.0.0"), ("local", "file:../local"),
+    ]
+
+
+@pytest.mark.parametrize("lockfile_version", [2, 3])
+def test_locked_packages_packages_map(tmp_path, lockfile_version):
+    workdir = write_lock(tmp_path, {
+        "lockfileVersion": lockfile_version,
+        "packages": {
+            "": {"name": "app", "version": "0.1.0"},
+            "node_modules/a": {"version": "1.0.0"},
+            "node_modules/a/node_modules/@scope/b": {"version": "2.0.0"},
+            "node_modules/alias": {"name": "real-name", "version": "4.0.0"},
+            "node_modules/linked": {"resolved": "packages/linked", "link": True},
+            "packages/linked": {"name": "linked", "version": "0.0.1"},
+        },
+        # v2 also carries the v1 tree; the packages map wins
+        "dependencies": {"stale": {"version": "9.9.9"}},
+    })
+    assert locked_packages(workdir) == [
+        ("@scope/b", "2.0.0"), ("a", "1.0.0"), ("linked", "0.0.1"), ("real-name", "4.0.0"),
+    ]
+
+
+def test_locked_packages_prefers_shrinkwrap(tmp_path):
+    write_lock(tmp_path, {"lockfileVersion": 1, "dependencies": {"lock": {"version": "1.0.0"}}})
+    workdir = write_lock(tmp_path, {"lockfileVersion": 1, "dependencies": {"shrink": {"version": "1.0.0"}}},
+                         name="npm-shrinkwrap.json")
+    assert locked_packages(workdir) == [("shrink", "1.0.0")]
+
+
+def test_locked_packages_without_lockfile(tmp_path):
+    assert locked_packages(str(tmp_path)) is None
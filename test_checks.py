@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for parsing streamed ESLint JSON output in the checks
+"""
+
+import json
+import os
+
+import pytest
+
+# app.config refuses to load without credentials; the parser never uses them
+os.environ.setdefault("GITHUB_TOKEN", "test_token")
+os.environ.setdefault("GEMINI_API_KEY", "test_key")
+os.environ.setdefault("WEBHOOK_SECRET", "test_secret")
+
+from app.checks import EslintReport
+
+WORKDIR = "/checkout"
+
+
+def eslint_output(files=5, messages=3):
+    """ESLint JSON formatter output with multibyte text in every message"""
+    results = []
+    for f in range(files):
+        results.append({
+            "filePath": f"{WORKDIR}/src/ファイル{f}.js",
+            "messages": [
+                {"ruleId": f"rule-{m}", "severity": 2 if m % 2 else 1, "line": m + 1, "column": 2,
+                 "message": f"Unexpected “{m}” — naïve 日本語 😀"}
+                for m in range(messages)
+            ],
+        })
+    return json.dumps(results, ensure_ascii=False).encode("utf-8")
+
+
+def parse(chunks):
+    report = EslintReport(WORKDIR)
+    for chunk in chunks:
+        report.feed(chunk)
+    return report
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1000])
+def test_feed_handles_elements_and_utf8_split_across_chunks(size):
+    data = eslint_output()
+    whole = parse([data])
+    report = parse(split(data, size))
+
+    assert whole.finish() and report.finish()
+    assert (report.errors, report.warnings) == (5, 10)
+    assert report.samples == whole.samples
+    assert "ファイル0.js" in report.by_file.most_common()[0][0]
+    assert all("�" not in sample for sample in report.samples)
+
+
+def test_feed_handles_whitespace_between_elements():
+    data = b'\n[ \n' + b' ,\n'.join(json.dumps({"filePath": f"{WORKDIR}/a{i}.js", "messages": [
+        {"ruleId": "semi", "severity": 2, "line": 1, "message": "Missing semicolon."}]}).encode()
+        for i in range(3)) + b'\n]\n'
+    report = parse(split(data, 5))
+
+    assert report.finish()
+    assert report.errors == 3
+    assert report.by_rule["semi"] == 3
+
+
+@pytest.mark.parametrize("cut", [1, 20, -2, -1])
+def test_truncated_report_is_not_finished(cut):
+    data = eslint_output()
+    report = parse(split(data[:cut], 7))
+    assert not report.finish()
+
+
+@pytest.mark.parametrize("data", [b"", b"Oops! Something went wrong!", b'{"error": "boom"}'])
+def test_non_array_output_is_not_finished(data):
+    assert not parse([data]).finish()
+
+
+def test_empty_report():
+    report = parse([b"[]\n"])
+    assert report.finish()
+    assert (report.errors, report.warnings) == (0, 0)
+
+
+@pytest.mark.parametrize("budget", [500, 2000, 20000])
+def test_summary_stays_within_budget(budget):
+    report = parse([eslint_output(files=200, messages=10)])
+    text = report.summary(budget)
+
+    assert len(text) <= budget
+    assert text.count("```") % 2 == 0
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for fitting the bot comment into GitHub's comment size limit
+"""
+
+import os
+
+import pytest
+
+# app.config refuses to load without credentials; fit_comment never uses them
+os.environ.setdefault("GITHUB_TOKEN", "test_token")
+os.environ.setdefault("GEMINI_API_KEY", "test_key")
+os.environ.setdefault("WEBHOOK_SECRET", "test_secret")
+
+from app.comments import MAX_COMMENT_CHARS, TRUNCATED, fit_comment
+
+
+def fenced(lines, line="x" * 79):
+    return "Details:\n```\n" + "\n".join([line] * lines) + "\n```\nEnd."
+
+
+def test_short_sections_are_joined_unchanged():
+    sections = ["## Review", "Looks good.", fenced(3)]
+    assert fit_comment(sections) == "\n\n".join(sections)
+
+
+@pytest.mark.parametrize("sections", [
+    [fenced(2000)],
+    ["## Review", fenced(1000), fenced(1000)],
+    ["a" * 70000, "b" * 70000, "c" * 10],
+    ["short"] * 50 + [fenced(5000)],
+    ["😀" * 40000, fenced(1000, line="日本語" * 20)],
+])
+def test_fit_comment_stays_within_the_limit(sections):
+    body = fit_comment(sections)
+    assert len(body) <= MAX_COMMENT_CHARS
+    assert TRUNCATED.strip() in body
+
+
+def test_cut_code_fence_is_closed():
+    body = fit_comment(["## Checks", fenced(2000)])
+    checks = body.split("\n\n", 1)[1]
+
+    assert body.count("```") % 2 == 0
+    assert checks.endswith("```" + TRUNCATED)
+
+
+def test_short_sections_keep_their_text():
+    review = "## Review\n" + "Important point. " * 100
+    body = fit_comment([review, fenced(2000)])
+
+    assert body.startswith(review + "\n\n")
+    assert len(body) <= MAX_COMMENT_CHARS
+
+
+@pytest.mark.parametrize("limit", [1000, 5000])
+def test_custom_limit(limit):
+    assert len(fit_comment([fenced(100), fenced(100)], limit=limit)) <= limit
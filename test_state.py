@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared state store's job queue
+Runs every case against SQLite and against Redis (via fakeredis)
+"""
+
+import json
+import os
+
+import pytest
+
+# From requirements-dev.txt
+fakeredis = pytest.importorskip("fakeredis")
+
+# app.config refuses to load without credentials; the store never uses them
+os.environ.setdefault("GITHUB_TOKEN", "test_token")
+os.environ.setdefault("GEMINI_API_KEY", "test_key")
+os.environ.setdefault("WEBHOOK_SECRET", "test_secret")
+
+from app.state import RedisStore, SQLiteStore
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "state.db"))
+    return RedisStore(client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def age(store, job, seconds):
+    """Pretend a claimed job was claimed `seconds` ago"""
+    if isinstance(store, SQLiteStore):
+        store._conn().execute(
+            "UPDATE jobs SET claimed_at = claimed_at - ? WHERE id = ?", (seconds, job["id"])
+        )
+    else:
+        raw = store.redis.hget(store._k("running"), job["key"])
+        lease = json.loads(raw)
+        lease["claimed_at"] -= seconds
+        store.redis.hset(store._k("running"), job["key"], json.dumps(lease))
+
+
+def test_one_running_job_per_key(store):
+    store.enqueue("o/r#1", "issues", {"n": 1})
+    store.enqueue("o/r#1", "issues", {"n": 2})
+    store.enqueue("o/r#2", "issues", {"n": 3})
+
+    first = store.claim("w")
+    second = store.claim("w")
+    assert first["payload"] == {"n": 1}
+    assert second["payload"] == {"n": 3}
+    assert store.claim("w") is None
+
+    store.complete(first)
+    assert store.claim("w")["payload"] == {"n": 2}
+
+
+def test_claim_by_priority_and_aging(store):
+    store.enqueue("o/r#1", "pull_request", {}, priority=3)
+    store.enqueue("o/r#2", "issues", {}, priority=1)
+
+    assert store.claim("w", priority=0) is None
+    assert store.claim("w", priority=1)["key"] == "o/r#2"
+    # The priority-3 job is one class away from 2: it needs `aging` seconds of waiting
+    assert store.claim("w", priority=2, aging=60) is None
+    assert store.claim("w", priority=2, aging=0)["key"] == "o/r#1"
+
+
+def test_repo_limit_is_per_class(store):
+    store.enqueue("o/r#1", "pull_request", {}, priority=3)
+    store.enqueue("o/r#2", "pull_request", {}, priority=3)
+    store.enqueue("o/r#3", "issues", {}, priority=1)
+
+    assert store.claim("w", repo_limit=1, priority=3)["key"] == "o/r#1"
+    assert store.claim("w", repo_limit=1, priority=3) is None
+    assert store.claim("w", repo_limit=1, priority=1)["key"] == "o/r#3"
+
+
+def test_release_returns_job_to_the_head(store):
+    store.enqueue("o/r#1", "issues", {"n": 1})
+    store.enqueue("o/r#1", "issues", {"n": 2})
+
+    job = store.claim("w")
+    store.release(job)
+    assert store.claim("w")["payload"] == {"n": 1}
+
+
+def test_stale_jobs_are_requeued(store):
+    store.enqueue("o/r#1", "issues", {})
+    job = store.claim("w")
+
+    assert store.requeue_stale(lease=900) == 0
+    age(store, job, 1000)
+    assert store.requeue_stale(lease=900) == 1
+    assert store.claim("w")["id"] == job["id"]
+
+
+def test_renewed_jobs_are_not_requeued(store):
+    store.enqueue("o/r#1", "issues", {})
+    job = store.claim("w")
+
+    age(store, job, 1000)
+    assert store.renew(job)
+    assert store.requeue_stale(lease=900) == 0
+
+
+def test_requeued_job_cannot_be_renewed_by_old_owner(store):
+    store.enqueue("o/r#1", "issues", {})
+    job = store.claim("w1")
+    age(store, job, 1000)
+    store.requeue_stale(lease=900)
+
+    again = store.claim("w2")
+    assert again["id"] == job["id"]
+    assert not store.renew(job)
+    assert store.renew(again)
+
+
+def test_kv_lock(store):
+    with store.lock("refresh", ttl=60, wait=0):
+        with pytest.raises(TimeoutError):
+            with store.lock("refresh", ttl=60, wait=0):
+                pass
+    with store.lock("refresh", ttl=60, wait=0):
+        pass
+
+
+def test_add_if_absent_expires(store):
+    assert store.add_if_absent("delivery:1", 1, ttl=60)
+    assert not store.add_if_absent("delivery:1", 1, ttl=60)
+    store.delete("delivery:1")
+    assert store.add_if_absent("delivery:1", 1, ttl=60)
+
+
+def test_requeued_job_is_only_completed_by_its_new_owner(store):
+    store.enqueue("o/r#1", "issues", {"n": 1})
+    store.enqueue("o/r#1", "issues", {"n": 2})
+    job = store.claim("w1")
+    age(store, job, 1000)
+    store.requeue_stale(lease=900)
+    again = store.claim("w2")
+
+    # The first worker finishing its copy must not free the key under the second
+    store.complete(job)
+    store.release(job)
+    assert store.claim("w3") is None
+    store.complete(again)
+    assert store.claim("w3")["payload"] == {"n": 2}
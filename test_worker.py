@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the job consumer feeding a pool's lanes
+"""
+
+import os
+import threading
+import time
+
+# app.config refuses to load without credentials; these tests never use them
+os.environ.setdefault("GITHUB_TOKEN", "test_token")
+os.environ.setdefault("GEMINI_API_KEY", "test_key")
+os.environ.setdefault("WEBHOOK_SECRET", "test_secret")
+
+from app import worker
+from app.scheduler import LaneScheduler
+from app.state import SQLiteStore
+
+
+def keys_for_lane(scheduler, lane, count):
+    keys = []
+    n = 0
+    while len(keys) < count:
+        n += 1
+        if scheduler.lane_for(f"o/r{n}#1") is scheduler.lanes[lane]:
+            keys.append(f"o/r{n}#1")
+    return keys
+
+
+def test_full_lane_does_not_block_other_lanes(tmp_path, monkeypatch):
+    store = SQLiteStore(str(tmp_path / "state.db"))
+    monkeypatch.setattr(worker, "get_store", lambda: store)
+    monkeypatch.setattr(worker, "JOB_POLL_SECONDS", 0.01)
+
+    unblock = threading.Event()
+    ran = []
+
+    def run(job):
+        ran.append(job["key"])
+        unblock.wait(5)
+
+    scheduler = LaneScheduler(2, 2, run)
+    busy = keys_for_lane(scheduler, 0, 4)
+    (free,) = keys_for_lane(scheduler, 1, 1)
+    # Lane 0 runs one job and holds two more; the fourth overflows it
+    for key in busy + [free]:
+        store.enqueue(key, "issues", {})
+    scheduler.start()
+
+    consumer = threading.Thread(target=worker._consume, args=("w", scheduler, 0), daemon=True)
+    consumer.start()
+    try:
+        deadline = time.time() + 5
+        while free not in ran and time.time() < deadline:
+            time.sleep(0.01)
+        assert free in ran
+    finally:
+        worker._stop.set()
+        unblock.set()
+        consumer.join(5)
+        scheduler.stop(5)
+        worker._stop.clear()
+        worker._held.clear()